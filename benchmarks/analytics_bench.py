@@ -0,0 +1,159 @@
+"""Population analytics: update cost, snapshot cost and cross-process merges.
+
+    python benchmarks/analytics_bench.py --users 1000000
+    python benchmarks/analytics_bench.py --users 50000 --processes 4 --verify
+
+Observes ``--users`` users with random profiles, then replays ``--updates``
+intake changes, profile changes and evictions against ``PopulationStats``
+and reports updates/sec and how long a snapshot takes.  The snapshot time
+should not grow with ``--users``.
+
+``--verify`` recomputes everything from scratch over the surviving users
+and fails unless the histogram, BMI counts and sums match exactly and every
+reported percentile is within the sketch's ``alpha`` of the true one.  It
+also splits the same users over ``--processes`` worker processes, each
+publishing a snapshot file, and checks that merging the files gives the
+single-process snapshot.
+"""
+
+import argparse
+import math
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from waterbuddy.analytics import PopulationStats, merge_snapshot_files, write_snapshot  # noqa: E402
+from waterbuddy.core import progress_percent  # noqa: E402
+from waterbuddy.rules import get_rules  # noqa: E402
+
+GOALS = (1200, 1500, 1700, 1900, 2200, 2500, 2700, 3000)
+QUANTILES = (0.01, 0.1, 0.25, 0.5, 0.75, 0.9, 0.99)
+
+
+def workload(users, updates, seed):
+    """Events ``(op, uid, goal, intake, bmi_cat)``; the same for every caller with the same seed."""
+    rng = random.Random(seed)
+    categories = get_rules().bmi_categories
+    state = {}
+    for uid in range(users):
+        state[uid] = (rng.choice(GOALS), 0, rng.choice(categories))
+        yield ("observe", uid, *state[uid])
+    for _ in range(updates):
+        uid = rng.randrange(users)
+        roll = rng.random()
+        if roll < 0.02:
+            state.pop(uid, None)
+            yield ("forget", uid, 0, 0, None)
+            continue
+        goal, intake, category = state.get(uid) or (rng.choice(GOALS), 0, rng.choice(categories))
+        if roll < 0.05:
+            goal, category = rng.choice(GOALS), rng.choice(categories)
+        else:
+            intake += rng.choice((250, 250, 500, 330))
+        state[uid] = (goal, intake, category)
+        yield ("observe", uid, goal, intake, category)
+
+
+def replay(stats, events, worker=0, workers=1):
+    start = time.perf_counter()
+    count = 0
+    for op, uid, goal, intake, category in events:
+        if uid % workers != worker:
+            continue
+        if op == "observe":
+            stats.observe(uid, goal, intake, category)
+        else:
+            stats.forget(uid)
+        count += 1
+    return count, time.perf_counter() - start
+
+
+def publish_share(args):
+    users, updates, seed, worker, workers, directory = args
+    stats = PopulationStats()
+    replay(stats, workload(users, updates, seed), worker, workers)
+    write_snapshot(stats.snapshot(), Path(directory) / f"worker-{worker}.json")
+
+
+def verify(stats, snapshot):
+    rules = get_rules()
+    users = stats._users.values()
+    progress = [0] * len(snapshot.progress)
+    bmi = dict.fromkeys(snapshot.bmi, 0)
+    values = {"goal": [], "intake": [], "progress": []}
+    for goal, intake, category in users:
+        percent = progress_percent(intake, goal)
+        progress[rules.progress.index(percent)] += 1
+        bmi[category] += 1
+        values["goal"].append(goal)
+        values["intake"].append(intake)
+        values["progress"].append(percent)
+    expected = (len(users), sum(values["goal"]), sum(values["intake"]), progress, bmi)
+    actual = (snapshot.users, snapshot.goal_sum, snapshot.intake_sum, snapshot.progress, snapshot.bmi)
+    if actual != expected:
+        sys.exit(f"FAIL: totals differ from a full recompute:\n  {actual}\n  {expected}")
+    worst = 0.0
+    for name, column in values.items():
+        column.sort()
+        alpha = snapshot.sketches[name].alpha
+        for q in QUANTILES:
+            true = column[math.floor(q * (len(column) - 1))]
+            got = snapshot.quantile(name, q)
+            error = abs(got - true) / true if true else abs(got)
+            worst = max(worst, error)
+            if error > alpha + 1e-12:
+                sys.exit(f"FAIL: {name} p{q * 100:g} is {got:.1f}, true value {true} (error {error:.4f} > {alpha})")
+    print(f"verified against a full recompute: exact totals, worst percentile error {worst:.4f}")
+
+
+def verify_merge(snapshot, args):
+    with tempfile.TemporaryDirectory() as tmp:
+        shares = [(args.users, args.updates, args.seed, i, args.processes, tmp) for i in range(args.processes)]
+        with ProcessPoolExecutor(args.processes) as pool:
+            list(pool.map(publish_share, shares))
+        merged = merge_snapshot_files(tmp, max_age=float("inf"))
+    ours, theirs = snapshot.to_dict(), merged.to_dict()
+    for d in (ours, theirs):
+        d.pop("taken_at")
+        d.pop("processes")
+    if ours != theirs:
+        sys.exit("FAIL: merged per-process snapshots differ from the single-process snapshot")
+    print(f"verified merge: {merged.processes} process snapshots == one process")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Incremental population analytics")
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--updates", type=int, default=2_000_000)
+    parser.add_argument("--processes", type=int, default=4, help="worker processes for the merge check")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--verify", action="store_true", help="check against a full recompute and a merge")
+    args = parser.parse_args()
+
+    stats = PopulationStats()
+    events = list(workload(args.users, args.updates, args.seed))
+    count, seconds = replay(stats, events)
+    print(f"{count:,} updates over {args.users:,} users in {seconds:.2f}s ({count / seconds:,.0f} updates/s)")
+
+    timings = []
+    for _ in range(50):
+        start = time.perf_counter()
+        snapshot = stats.snapshot()
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    print(f"{len(stats):,} active users; snapshot median {timings[len(timings) // 2] * 1e6:.0f} µs, "
+          f"{sum(len(s.bins) for s in snapshot.sketches.values())} sketch bins, "
+          f"median progress {snapshot.quantile('progress', 0.5):.0f}%, mean goal {snapshot.mean_goal:,.0f} ml")
+
+    if args.verify:
+        verify(stats, snapshot)
+        verify_merge(snapshot, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""Load generator for the asyncio HTTP API.
+
+Starts ``python -m waterbuddy.api`` on a temporary database (or targets
+``--host/--port`` of a running one), opens ``--connections`` keep-alive
+connections and has each send requests back to back for ``--seconds``.
+Reports requests/sec and p50/p99 latency per endpoint mix.
+
+    python benchmarks/api_load.py --connections 64 --seconds 5
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+CONDITIONS = ["Normal / Healthy", "Athlete / High Activity", "Pregnant", "Breastfeeding"]
+
+
+def _profile(rng):
+    return {
+        "age": rng.randint(1, 120),
+        "height": rng.randint(120, 210),
+        "weight": rng.randint(30, 150),
+        "condition": rng.choice(CONDITIONS),
+    }
+
+
+def _request(method, path, payload):
+    body = json.dumps(payload).encode()
+    return (
+        f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\n\r\n"
+    ).encode() + body
+
+
+async def _read_response(reader):
+    head = await reader.readuntil(b"\r\n\r\n")
+    status = int(head.split(b" ", 2)[1])
+    length = 0
+    for line in head.split(b"\r\n"):
+        if line.lower().startswith(b"content-length:"):
+            length = int(line.split(b":", 1)[1])
+    await reader.readexactly(length)
+    return status
+
+
+async def _client(host, port, worker, args, deadline, latencies, errors):
+    rng = random.Random(worker)
+    reader, writer = await asyncio.open_connection(host, port)
+    user_id = f"load-{worker}"
+    writer.write(_request("PUT", f"/v1/users/{user_id}/profile", _profile(rng)))
+    await _read_response(reader)
+    while time.perf_counter() < deadline:
+        if rng.random() < args.goal_share:
+            payload = [_profile(rng) for _ in range(args.batch)] if args.batch > 1 else _profile(rng)
+            request = _request("POST", "/v1/goal", payload)
+        else:
+            request = _request("POST", f"/v1/users/{user_id}/intake", {"ml": rng.choice((250, 500))})
+        start = time.perf_counter()
+        writer.write(request)
+        status = await _read_response(reader)
+        latencies.append(time.perf_counter() - start)
+        if status != 200:
+            errors.append(status)
+    writer.close()
+
+
+async def run_load(host, port, args):
+    latencies, errors = [], []
+    start = time.perf_counter()
+    deadline = start + args.seconds
+    await asyncio.gather(
+        *(_client(host, port, i, args, deadline, latencies, errors) for i in range(args.connections))
+    )
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    n = len(latencies)
+    return {
+        "requests": n,
+        "errors": len(errors),
+        "requests_per_sec": round(n / elapsed),
+        "p50_ms": round(latencies[n // 2] * 1000, 3),
+        "p99_ms": round(latencies[min(n - 1, int(n * 0.99))] * 1000, 3),
+    }
+
+
+async def _wait_for_port(host, port, timeout=10):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            _, writer = await asyncio.open_connection(host, port)
+            writer.close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.05)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the WaterBuddy HTTP API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=0, help="target a running server instead of starting one")
+    parser.add_argument("--connections", type=int, default=64)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--goal-share", type=float, default=0.5, help="fraction of requests hitting /v1/goal")
+    parser.add_argument("--batch", type=int, default=1, help="profiles per /v1/goal request")
+    args = parser.parse_args()
+
+    server = None
+    port = args.port
+    with tempfile.TemporaryDirectory() as tmp:
+        if not port:
+            port = 18000 + os.getpid() % 1000
+            server = subprocess.Popen(
+                [sys.executable, "-m", "waterbuddy.api", "--port", str(port), "--db", os.path.join(tmp, "api.db")],
+                cwd=ROOT,
+            )
+        try:
+            asyncio.run(_wait_for_port(args.host, port))
+            result = asyncio.run(run_load(args.host, port, args))
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait()
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""Shared plumbing for benchmarks that drive ``app.py`` through ``AppTest``.
+
+``RunCapture`` keeps the forward messages of every script run and can replay
+a click as a fragment rerun, the way the browser sends it when the widget
+lives inside an ``st.fragment``; plain ``AppTest`` always reruns the whole
+script.
+"""
+
+import dataclasses
+import json
+import logging
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from streamlit.runtime.forward_msg_cache import create_reference_msg
+from streamlit.runtime.scriptrunner_utils.script_requests import ScriptRequests
+from streamlit.testing.v1 import AppTest
+from streamlit.testing.v1.local_script_runner import LocalScriptRunner
+
+APP = Path(__file__).resolve().parents[1] / "app.py"
+
+
+class RunCapture:
+    """Records the forward messages of every run and routes fragment reruns."""
+
+    def __init__(self):
+        self.runs = []
+        self.fragment_id = None
+        # last run's messages per session, keyed by the session state object
+        self._last_run = {}
+
+    def __enter__(self):
+        self._run = LocalScriptRunner.run
+        self._request_rerun = LocalScriptRunner.request_rerun
+        capture = self
+
+        def run(runner, *args, **kwargs):
+            try:
+                return capture._run(runner, *args, **kwargs)
+            finally:
+                msgs = list(runner.forward_msgs())
+                capture.runs.append(msgs)
+                capture._last_run[id(runner.session_state)] = msgs
+
+        def request_rerun(runner, rerun_data):
+            if capture.fragment_id:
+                # The runner starts out with a placeholder full-app rerun
+                # request, which would swallow the fragment request.
+                runner._requests = ScriptRequests()
+                rerun_data = dataclasses.replace(rerun_data, fragment_id_queue=[capture.fragment_id])
+            return capture._request_rerun(runner, rerun_data)
+
+        LocalScriptRunner.run = run
+        LocalScriptRunner.request_rerun = request_rerun
+        return self
+
+    def __exit__(self, *exc):
+        LocalScriptRunner.run = self._run
+        LocalScriptRunner.request_rerun = self._request_rerun
+
+    def _element(self, key, at=None):
+        """(widget id, fragment id) of the widget with ``key`` in the last run.
+
+        With ``at``, the last run of that session rather than of any session.
+        """
+        msgs = self.runs[-1] if at is None else self._last_run[id(at._session_state)]
+        for msg in msgs:
+            if not msg.HasField("delta") or not msg.delta.HasField("new_element"):
+                continue
+            element = msg.delta.new_element
+            widget_id = getattr(getattr(element, element.WhichOneof("type")), "id", "")
+            if widget_id.endswith("-" + key):
+                return widget_id, msg.delta.fragment_id
+        raise KeyError(key)
+
+    def fragment_of(self, key, at=None):
+        """Fragment id of the widget with ``key`` in the last run ('' if none)."""
+        return self._element(key, at)[1]
+
+    def _interact(self, at, fragment_id, run):
+        self.fragment_id = fragment_id or None
+        try:
+            start = time.perf_counter()
+            run()
+            elapsed = time.perf_counter() - start
+        finally:
+            fragment_id, self.fragment_id = self.fragment_id, None
+        if at.exception:
+            raise RuntimeError(at.exception[0].message)
+        return elapsed, fragment_id
+
+    def click(self, at, key):
+        """Click ``key`` and run; returns (seconds, fragment id or None)."""
+        return self._interact(at, self.fragment_of(key, at), lambda: at.button(key=key).click().run())
+
+    def send(self, at, key, value):
+        """``send_value`` replayed as a fragment rerun when the component is in one."""
+        return self._interact(at, self.fragment_of(key, at), lambda: send_value(at, key, value))
+
+
+def send_value(at, key, value):
+    """Have custom component ``key`` report ``value``, as the browser would.
+
+    ``AppTest`` cannot drive custom components, so the JSON value is added to
+    the widget states of the next run by hand.
+    """
+    widget_id = next(e.proto.id for e in at.get("component_instance") if e.proto.id.endswith("-" + key))
+    states = at._tree.get_widget_states()
+    state = states.widgets.add()
+    state.id = widget_id
+    state.json_value = json.dumps(value)
+    return at._run(states)
+
+
+def tap_batch(at, *amounts):
+    """The next batch of quick-add taps the intake buttons component would send."""
+    seq = at.session_state["intake_batch_seq"] if "intake_batch_seq" in at.session_state else 0
+    return {"seq": seq + len(amounts), "amounts": list(amounts)}
+
+
+def delta_stats(msgs, browser_cache=None):
+    """Message counts and sizes for one run.
+
+    ``wire_bytes`` is what actually goes out once the browser has cached
+    earlier cacheable messages: those are replaced by hash references.
+    ``browser_cache`` is updated with this run's cacheable hashes.
+    """
+    browser_cache = set() if browser_cache is None else browser_cache
+    deltas = [m for m in msgs if m.HasField("delta")]
+    wire = 0
+    for m in msgs:
+        if m.metadata.cacheable and m.hash in browser_cache:
+            wire += create_reference_msg(m).ByteSize()
+        else:
+            wire += m.ByteSize()
+    browser_cache.update(m.hash for m in msgs if m.metadata.cacheable)
+    return {
+        "delta_messages": len(deltas),
+        "elements": sum(1 for m in deltas if m.delta.HasField("new_element")),
+        "delta_bytes": sum(m.ByteSize() for m in deltas),
+        "total_bytes": sum(m.ByteSize() for m in msgs),
+        "wire_bytes": wire,
+    }
+
+
+def new_app():
+    return AppTest.from_file(str(APP), default_timeout=30)
+
+
+def to_summary(at):
+    at.run()
+    at.button[0].click().run()
+    at.run()
+    return at
+
+
+def to_tracking(at):
+    to_summary(at)
+    at.button(key="start_tracking").click().run()
+    at.run()
+    return at
+
+
+def to_reset_confirm(at):
+    to_tracking(at)
+    send_value(at, "intake_buttons", tap_batch(at, 250))
+    at.button(key="reset_tracking").click().run()
+    return at
+
+
+@contextmanager
+def quiet_app_env():
+    """Silence Streamlit's logging and point the app at a throwaway database."""
+    logging.disable(logging.WARNING)
+    with tempfile.TemporaryDirectory() as tmp:
+        previous = os.environ.get("WATERBUDDY_DB")
+        os.environ["WATERBUDDY_DB"] = os.path.join(tmp, "bench.db")
+        try:
+            yield
+        finally:
+            if previous is None:
+                os.environ.pop("WATERBUDDY_DB", None)
+            else:
+                os.environ["WATERBUDDY_DB"] = previous
+            logging.disable(logging.NOTSET)
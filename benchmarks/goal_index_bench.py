@@ -0,0 +1,75 @@
+"""Goal lookups through the precomputed index against the scalar functions.
+
+    python benchmarks/goal_index_bench.py
+    python benchmarks/goal_index_bench.py --verify --samples 1000000
+    python benchmarks/goal_index_bench.py --verify --full
+
+Builds the index into a temporary file, then times ``--lookups`` random
+in-domain profiles through ``waterbuddy.core.goal_breakdown`` and through
+``GoalIndex.breakdown`` and ``GoalIndex.goal``, and reports lookups/sec for
+each.  ``--verify`` checks the index against ``goal_breakdown`` (see
+``waterbuddy.goal_index.verify``); ``--full`` compares all 72 million
+profiles, which takes several minutes.
+"""
+
+import argparse
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from waterbuddy.core import goal_breakdown  # noqa: E402
+from waterbuddy.goal_index import MAX_AGE, MAX_HEIGHT, MAX_WEIGHT, GoalIndex, build, verify  # noqa: E402
+from waterbuddy.rules import get_rules  # noqa: E402
+
+
+def profiles(count, seed):
+    rng = random.Random(seed)
+    conditions = get_rules().conditions
+    return [(rng.randint(1, MAX_AGE), rng.randint(1, MAX_HEIGHT), rng.randint(1, MAX_WEIGHT),
+             rng.choice(conditions)) for _ in range(count)]
+
+
+def rate(func, inputs, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for age, height, weight, condition in inputs:
+            func(age, height, weight, condition)
+        best = min(best, time.perf_counter() - start)
+    return len(inputs) / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precomputed goal index vs the scalar path")
+    parser.add_argument("--lookups", type=int, default=500_000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--verify", action="store_true", help="check the index against waterbuddy.core")
+    parser.add_argument("--samples", type=int, default=100_000, help="random whole profiles for --verify")
+    parser.add_argument("--full", action="store_true", help="with --verify, compare the whole domain")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "goals.idx"
+        start = time.perf_counter()
+        build(path)
+        print(f"built {path.stat().st_size:,} bytes in {time.perf_counter() - start:.2f}s")
+        index = GoalIndex(path)
+        inputs = profiles(args.lookups, args.seed)
+        scalar = rate(goal_breakdown, inputs)
+        results = (("core.goal_breakdown", scalar), ("GoalIndex.breakdown", rate(index.breakdown, inputs)),
+                   ("GoalIndex.goal", rate(index.goal, inputs)))
+        for label, per_second in results:
+            print(f"{label:20} {per_second:12,.0f} lookups/s  ({per_second / scalar:4.1f}x)")
+        if args.verify:
+            start = time.perf_counter()
+            checked = verify(index, args.samples, args.seed, full=args.full)
+            print(f"verified {checked:,} lookups against waterbuddy.core in {time.perf_counter() - start:.1f}s")
+        index.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Day history: cost of archiving and of reading the summary, and a brute-force check.
+
+    python benchmarks/history_bench.py --days 3650
+    python benchmarks/history_bench.py --days 2000 --verify
+
+Archives ``--days`` days for one user, skipping some calendar days and
+missing the goal on others, then times ``summary()`` on the result.  The
+summary should cost the same after 30 days as after ten years.
+
+``--verify`` checks the streak, both rolling averages and the best day after
+every archive and every skipped day against a recomputation from the raw
+arrays.
+"""
+
+import argparse
+import random
+import sys
+import time
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from waterbuddy.history import WINDOWS, DayHistory  # noqa: E402
+
+START = 738_000  # an arbitrary ordinal date
+
+
+def brute_force(history, end):
+    dates, totals, goals = list(history.dates), list(history.totals), list(history.goals)
+    by_date = dict(zip(dates, zip(totals, goals)))
+    streak, day = 0, end
+    while day in by_date and by_date[day][1] > 0 and by_date[day][0] >= by_date[day][1]:
+        streak += 1
+        day -= 1
+    averages = {}
+    for window in WINDOWS:
+        days = min(window, end - dates[0] + 1)
+        averages[window] = sum(t for d, t in zip(dates, totals) if end - window < d <= end) / days
+    best = max(totals)
+    return streak, averages, best
+
+
+def check(history, end):
+    streak, averages, best = brute_force(history, end)
+    got = (history.streak, {w: history.average(w) for w in WINDOWS}, history.best_day[1])
+    if history.end != end or got[0] != streak or got[2] != best or any(
+            abs(got[1][w] - averages[w]) > 1e-9 for w in WINDOWS):
+        sys.exit(f"FAIL at day {end - START}: got {got}, expected {(streak, averages, best)}")
+
+
+def build(days, rng, verify):
+    history = DayHistory()
+    date = START
+    start = time.perf_counter()
+    for _ in range(days):
+        date += 1
+        roll = rng.random()
+        if roll < 0.15:
+            # nothing drunk: the day is only skipped over
+            history.advance_to(date)
+        else:
+            goal = rng.choice((1700, 2200, 2500))
+            total = goal + rng.randint(-900, 600) if roll < 0.5 else goal + rng.randint(0, 800)
+            history.archive(date, total, goal)
+        if verify:
+            check(history, date)
+    return history, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Incremental day history aggregates")
+    parser.add_argument("--days", type=int, default=3650)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--verify", action="store_true", help="check every step against a recomputation")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    for days in sorted({30, args.days}):
+        history, seconds = build(days, rng, args.verify and days == args.days)
+        number = 100_000
+        per_call = min(timeit.repeat(lambda: history.summary(1500, 2200), number=number, repeat=5)) / number
+        print(f"{days:6,} days ({len(history):,} archived): {days / seconds:10,.0f} days/s archived, "
+              f"summary {per_call * 1e6:.2f} us, streak {history.streak}, "
+              f"7-day avg {history.average(7):,.0f} ml")
+    if args.verify:
+        print(f"verified {args.days:,} days against a recomputation")
+
+
+if __name__ == "__main__":
+    main()
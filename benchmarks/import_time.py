@@ -0,0 +1,58 @@
+"""Cold-start guard for the headless core.
+
+Imports ``waterbuddy.core`` in fresh interpreters and fails if the best of
+``--runs`` attempts exceeds the budget, or if the import drags in Streamlit,
+NumPy or pandas.
+
+    python benchmarks/import_time.py --budget-ms 30
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+FORBIDDEN = ("streamlit", "numpy", "pandas", "sqlite3")
+
+PROBE = f"""
+import sys, time
+start = time.perf_counter()
+import waterbuddy.core
+waterbuddy.core.goal_breakdown(30, 170, 65, "Normal / Healthy")
+elapsed = time.perf_counter() - start
+import json
+print(json.dumps({{"ms": elapsed * 1000, "loaded": [m for m in {FORBIDDEN!r} if m in sys.modules]}}))
+"""
+
+
+def measure(runs):
+    samples = []
+    loaded = set()
+    for _ in range(runs):
+        out = subprocess.run(
+            [sys.executable, "-c", PROBE], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout
+        result = json.loads(out)
+        samples.append(result["ms"])
+        loaded.update(result["loaded"])
+    return min(samples), sorted(loaded)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import-time budget for waterbuddy.core")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=30.0)
+    args = parser.parse_args()
+
+    best, loaded = measure(args.runs)
+    print(f"import waterbuddy.core + first goal: {best:.1f} ms (budget {args.budget_ms:.0f} ms)")
+    if loaded:
+        sys.exit(f"FAIL: heavy modules imported: {', '.join(loaded)}")
+    if best > args.budget_ms:
+        sys.exit("FAIL: over budget")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""Multi-session load simulation across a process pool.
+
+Each worker process holds its share of independent ``AppTest`` sessions open
+at once and walks them through a realistic flow, one step at a time across
+all of them: fill ``input_form``, open the summary, "Start Tracking!", a
+burst of quick-add taps and ``add_custom`` clicks, then reset.  For every
+session count in ``--sessions`` it reports aggregate reruns/sec, rerun latency
+percentiles and resident memory per open session.  Each worker stands in for
+a separate server with its own database.
+
+    python benchmarks/load_sim.py --sessions 8,32,128 --clicks 10
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from apptest_harness import RunCapture, new_app, quiet_app_env, tap_batch, to_tracking
+
+CONDITIONS = ["Normal / Healthy", "Athlete / High Activity", "Pregnant", "Breastfeeding"]
+
+
+def _rss_bytes():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def _timed(latencies, fn):
+    start = time.perf_counter()
+    fn()
+    latencies.append(time.perf_counter() - start)
+
+
+def _flow(rng, clicks):
+    """Steps of one user's visit, each a function (app, capture, latencies)."""
+
+    def fill_form(at, capture, lat):
+        at.number_input[0].set_value(rng.randint(5, 90))
+        at.number_input[1].set_value(rng.randint(110, 200))
+        at.number_input[2].set_value(rng.randint(20, 140))
+        at.selectbox[0].set_value(rng.choice(CONDITIONS))
+        _timed(lat, lambda: at.button[0].click().run())
+        _timed(lat, at.run)
+
+    def start_tracking(at, capture, lat):
+        lat.append(capture.click(at, "start_tracking")[0])
+        _timed(lat, at.run)
+
+    def drink(at, capture, lat):
+        if rng.random() < 0.7:
+            lat.append(capture.send(at, "intake_buttons", tap_batch(at, 250))[0])
+        else:
+            at.text_input(key="custom_amount_input").set_value(str(rng.randint(50, 400)))
+            lat.append(capture.click(at, "add_custom")[0])
+
+    def reset(at, capture, lat):
+        lat.append(capture.click(at, "reset_tracking")[0])
+        lat.append(capture.click(at, "confirm_reset")[0])
+
+    return [fill_form, start_tracking] + [drink] * clicks + [reset]
+
+
+def worker(n_sessions, clicks, seed, db_path):
+    rng = random.Random(seed)
+    latencies = []
+    with quiet_app_env(), RunCapture() as capture:
+        # after quiet_app_env, which points WATERBUDDY_DB at its own temp file
+        os.environ["WATERBUDDY_DB"] = db_path
+        # Warm up imports and caches so the first session is not billed for
+        # them; the tracking page's component pulls in pyarrow on first use.
+        to_tracking(new_app())
+        rss_before = _rss_bytes()
+        start = time.perf_counter()
+        sessions = [new_app() for _ in range(n_sessions)]
+        for at in sessions:
+            _timed(latencies, at.run)
+        flows = [_flow(random.Random(rng.random()), clicks) for _ in sessions]
+        for step in range(len(flows[0])):
+            for at, flow in zip(sessions, flows):
+                flow[step](at, capture, latencies)
+                if at.exception:
+                    raise RuntimeError(at.exception[0].message)
+        elapsed = time.perf_counter() - start
+        rss_after = _rss_bytes()
+    return {"latencies": latencies, "elapsed": elapsed, "rss_delta": rss_after - rss_before, "sessions": n_sessions}
+
+
+def simulate(n_sessions, workers, clicks, db_path):
+    shares = [n_sessions // workers + (i < n_sessions % workers) for i in range(workers)]
+    shares = [s for s in shares if s]
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=len(shares)) as pool:
+        # one database per worker, as a Store is its file's only writer
+        results = list(pool.map(worker, shares, [clicks] * len(shares), range(len(shares)),
+                                [f"{db_path}.{i}" for i in range(len(shares))]))
+    wall = time.perf_counter() - start
+    latencies = sorted(lat for r in results for lat in r["latencies"])
+    n = len(latencies)
+
+    def pct(p):
+        return round(latencies[min(n - 1, int(n * p))] * 1000, 2)
+
+    return {
+        "sessions": n_sessions,
+        "workers": len(shares),
+        "reruns": n,
+        "reruns_per_sec": round(n / max(r["elapsed"] for r in results), 1),
+        "wall_sec": round(wall, 2),
+        "p50_ms": pct(0.50),
+        "p95_ms": pct(0.95),
+        "p99_ms": pct(0.99),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 2),
+        "rss_per_session_kb": round(sum(r["rss_delta"] for r in results) / n_sessions / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent-session load simulation")
+    parser.add_argument("--sessions", default="4,16,64", help="comma-separated session counts")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--clicks", type=int, default=8, help="intake clicks per session")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for count in (int(c) for c in args.sessions.split(",")):
+            result = simulate(count, min(args.workers, count), args.clicks, os.path.join(tmp, f"load-{count}.db"))
+            print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()
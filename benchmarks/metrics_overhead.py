@@ -0,0 +1,77 @@
+"""What the metrics layer costs, switched off and switched on.
+
+    python benchmarks/metrics_overhead.py
+
+First times a trivial function called directly, through ``NullMetrics.timed``
+(metrics off) and through ``Metrics.timed`` (metrics on).  Then reruns the
+tracking page ``--reruns`` times in two fresh interpreters, one with
+``WATERBUDDY_METRICS`` unset and one with it set to 1, and compares median
+rerun times.  ``get_metrics()`` is read once per process, hence the
+separate interpreters.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import timeit
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+sys.path.insert(0, str(HERE.parent))
+
+from waterbuddy.metrics import METRICS_ENV_VAR, Metrics, NullMetrics  # noqa: E402
+
+PROBE = """
+import json, statistics, sys, time
+sys.path.insert(0, {here!r})
+from apptest_harness import new_app, quiet_app_env, to_tracking
+with quiet_app_env():
+    at = to_tracking(new_app())
+    times = []
+    for _ in range({reruns}):
+        start = time.perf_counter()
+        at.run()
+        times.append(time.perf_counter() - start)
+print(json.dumps({{"median_ms": statistics.median(times) * 1000}}))
+"""
+
+
+def per_call(number):
+    def noop():
+        return None
+
+    results = {}
+    for label, func in (("plain", noop), ("metrics off", NullMetrics().timed(noop)),
+                        ("metrics on", Metrics().timed(noop))):
+        best = min(timeit.repeat(func, number=number, repeat=5))
+        results[label] = best / number * 1e9
+    return results
+
+
+def rerun_median(reruns, enabled):
+    env = dict(os.environ)
+    env.pop(METRICS_ENV_VAR, None)
+    if enabled:
+        env[METRICS_ENV_VAR] = "1"
+    out = subprocess.run([sys.executable, "-c", PROBE.format(here=str(HERE), reruns=reruns)],
+                         env=env, check=True, capture_output=True, text=True).stdout
+    return json.loads(out.strip().splitlines()[-1])["median_ms"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Overhead of the opt-in metrics layer")
+    parser.add_argument("--calls", type=int, default=200_000)
+    parser.add_argument("--reruns", type=int, default=200)
+    args = parser.parse_args()
+
+    for label, ns in per_call(args.calls).items():
+        print(f"{label:12} {ns:8.0f} ns/call")
+    off = rerun_median(args.reruns, False)
+    on = rerun_median(args.reruns, True)
+    print(f"tracking rerun median: off {off:.2f} ms, on {on:.2f} ms ({(on - off) / off:+.1%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""Reminder scheduler under a simulated day of a million users.
+
+    python benchmarks/reminder_bench.py --users 1000000
+    python benchmarks/reminder_bench.py --users 20000 --verify
+
+Runs ``ReminderScheduler`` against a fake clock: every user starts the day
+with an empty glass and opens the app at a random time in the first
+``--join-hours``, the clock advances ``--tick`` seconds at a time, and
+each tick drains the due reminders in batches of ``--batch``.  A share of
+reminded users (``--drink-rate``) drinks one sip, which reschedules them.
+It reports scheduling throughput, per-tick drain latency and peak memory.
+
+``--verify`` replays the same day against a brute-force model that keeps a
+plain dict of due times and scans all of it on every tick, and fails unless
+both hand out exactly the same reminders in the same order.
+"""
+
+import argparse
+import random
+import resource
+import statistics
+import sys
+import time
+from array import array
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from waterbuddy.reminders import SIP_ML, ReminderScheduler, next_nudge_delay  # noqa: E402
+
+GOALS = (1700, 2000, 2200, 2500, 2700)
+DAY = 16 * 3600
+
+
+class FakeClock:
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class BruteForce:
+    """Same policy as ``ReminderScheduler``, one dict and a full scan per drain."""
+
+    def __init__(self, clock, day_end):
+        self.clock = clock
+        self.day_end = day_end
+        self.due = {}
+
+    def update(self, user_id, goal, intake, now=None):
+        now = self.clock() if now is None else now
+        delay = next_nudge_delay(goal, intake, self.day_end(now) - now)
+        if delay is None:
+            self.due.pop(user_id, None)
+        else:
+            self.due[user_id] = (now + delay, goal, intake)
+
+    def drain(self, limit=None):
+        now = self.clock()
+        ready = sorted((due, uid) for uid, (due, _, _) in self.due.items() if due <= now)[:limit]
+        batch = []
+        for due, uid in ready:
+            _, goal, intake = self.due[uid]
+            batch.append((uid, due))
+            self.update(uid, goal, intake)
+        return batch
+
+
+def simulate(scheduler, clock, users, args, rng, log=None):
+    goals = array("l", (rng.choice(GOALS) for _ in range(users)))
+    joins = array("d", (rng.uniform(0, args.join_hours * 3600) for _ in range(users)))
+    intake = array("l", bytes(8 * users))
+    start = time.perf_counter()
+    for uid in range(users):
+        scheduler.update(uid, goals[uid], 0, now=joins[uid])
+    schedule_s = time.perf_counter() - start
+
+    tick_ms, sent, drinks = [], 0, 0
+    while clock.now < DAY:
+        clock.now += args.tick
+        start = time.perf_counter()
+        while True:
+            batch = scheduler.drain(args.batch)
+            for reminder in batch:
+                uid = reminder[0]
+                if log is not None:
+                    log.append((uid, reminder[1]))
+                if rng.random() < args.drink_rate:
+                    intake[uid] += SIP_ML
+                    drinks += 1
+                    scheduler.update(uid, goals[uid], intake[uid])
+            sent += len(batch)
+            if len(batch) < args.batch:
+                break
+        tick_ms.append((time.perf_counter() - start) * 1000)
+    return schedule_s, tick_ms, sent, drinks
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Heap reminder scheduler with simulated users")
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--tick", type=float, default=60.0, help="simulated seconds per tick")
+    parser.add_argument("--batch", type=int, default=10_000, help="reminders per drain call")
+    parser.add_argument("--join-hours", type=float, default=4.0, help="users first open the app within this")
+    parser.add_argument("--drink-rate", type=float, default=0.3, help="share of reminders followed by a sip")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--verify", action="store_true", help="compare against a brute-force scan")
+    args = parser.parse_args()
+
+    clock = FakeClock()
+    scheduler = ReminderScheduler(clock=clock, day_end=lambda now: DAY)
+    log = [] if args.verify else None
+    schedule_s, tick_ms, sent, drinks = simulate(scheduler, clock, args.users, args, random.Random(args.seed), log)
+    ticks = sorted(tick_ms)
+    print(f"{args.users:,} users: scheduled in {schedule_s:.2f}s ({args.users / schedule_s:,.0f} updates/s)")
+    print(f"{len(ticks)} ticks of {args.tick:.0f}s: {sent:,} reminders, {drinks:,} sips logged")
+    print(f"tick drain ms: p50 {statistics.median(ticks):.2f}  p99 {ticks[int(len(ticks) * 0.99)]:.2f}  "
+          f"max {ticks[-1]:.2f}  ({sent / (sum(ticks) / 1000):,.0f} reminders/s)")
+    print(f"still scheduled at day end: {len(scheduler):,}; "
+          f"peak RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MiB")
+
+    if args.verify:
+        clock = FakeClock()
+        model = BruteForce(clock, lambda now: DAY)
+        expected = []
+        simulate(model, clock, args.users, args, random.Random(args.seed), expected)
+        if log != expected:
+            first = next(i for i, (a, b) in enumerate(zip(log, expected)) if a != b) if len(log) == len(expected) else "-"
+            sys.exit(f"FAIL: scheduler and brute force disagree ({len(log)} vs {len(expected)} reminders, "
+                     f"first difference at {first})")
+        print(f"verified against brute force: {len(log):,} identical reminders")
+
+
+if __name__ == "__main__":
+    main()
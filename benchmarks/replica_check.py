@@ -0,0 +1,242 @@
+"""Several replica processes writing the same users through shared shard files.
+
+    python benchmarks/replica_check.py
+    python benchmarks/replica_check.py --replicas 8 --shards 4 --users 10 --ops 2000 --app-sessions 0
+
+Starts ``--replicas`` processes over one set of ``--shards`` shard files, the
+way several Streamlit servers behind a load balancer would run.  Each
+replica has its own ``ShardedStore`` and ``SessionRegistry`` (its
+read-through cache) and ``--threads`` threads standing in for concurrent
+sessions.  All of them add drinks (one at a time, and in API-style batches of
+several), undo drinks and start new days for the same ``--users`` users, so
+every user is written from every replica at once and version conflicts are
+the norm rather than the exception.
+
+With ``--app-sessions`` each replica then also opens that many real app
+sessions (``AppTest``, with ``WATERBUDDY_SHARDS`` pointing at the same files)
+on random users' trackers by ``?uid=`` and taps cups.
+
+Once every replica is done, each reads every user back through its own
+registry.  The run fails unless, for every user:
+
+- the ml stored equals what was added minus what undos removed
+- every replica's record has the shard's version, current-day total and
+  events, i.e. no replica is left serving a stale cache
+"""
+
+import argparse
+import logging
+import multiprocessing
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+sys.path.insert(0, str(HERE.parent))
+
+from waterbuddy.rules import get_rules  # noqa: E402
+from waterbuddy.session import SessionRegistry  # noqa: E402
+from waterbuddy.sharding import SHARDS_ENV_VAR, ShardedStore  # noqa: E402
+
+AMOUNTS = (250, 330, 500)
+TAPS = (250, 500)
+
+
+# The same writes app.py's record_drink, undo_drink and start_new_day make.
+
+def record_drink(rec, store, ml):
+    log = rec.intake_log
+    ts = time.time()
+    log.append(ml, ts)
+    rec.version = store.record_intake(rec.user_id, log.day, ts, ml, expected_version=rec.version)
+
+
+# The same write HydrationAPI makes for a POST of several drinks: one
+# versioned write, so a retry cannot store the first drinks twice.
+def record_drinks(rec, store, amounts):
+    log = rec.intake_log
+    ts = time.time()
+    for ml in amounts:
+        log.append(ml, ts)
+    rec.version = store.record_intakes(rec.user_id, log.day, ts, amounts, expected_version=rec.version)
+
+
+def undo_drink(rec, store):
+    log = rec.intake_log
+    ml = log.undo_last()
+    if ml:
+        rec.version = store.undo_intake(rec.user_id, log.day, expected_version=rec.version)
+    return ml
+
+
+def new_day(rec, store):
+    log = rec.intake_log
+    log.start_new_day()
+    rec.version = store.set_current_day(rec.user_id, log.day, expected_version=rec.version)
+
+
+def user_ids(count):
+    return [f"user-{i}" for i in range(count)]
+
+
+def hammer(registry, args, seed, added, removed, lock, errors):
+    try:
+        run_ops(registry, args, seed, added, removed, lock)
+    except Exception as e:
+        errors.append(repr(e))
+
+
+def run_ops(registry, args, seed, added, removed, lock):
+    store = registry.store
+    rng = random.Random(seed)
+    users = user_ids(args.users)
+    for _ in range(args.ops):
+        uid = rng.choice(users)
+        roll = rng.random()
+        if roll < 0.6:
+            ml = rng.choice(AMOUNTS)
+            registry.update(uid, record_drink, store, ml)
+            with lock:
+                added[uid] += ml
+        elif roll < 0.8:
+            amounts = rng.choices(AMOUNTS, k=rng.randint(2, 4))
+            registry.update(uid, record_drinks, store, amounts)
+            with lock:
+                added[uid] += sum(amounts)
+        elif roll < 0.97:
+            ml = registry.update(uid, undo_drink, store)
+            with lock:
+                removed[uid] += ml
+        else:
+            registry.update(uid, new_day, store)
+
+
+def app_sessions(args, index, added):
+    from apptest_harness import new_app, send_value, tap_batch
+
+    logging.disable(logging.WARNING)
+    rng = random.Random(args.seed * 7919 + index)
+    users = user_ids(args.users)
+    for _ in range(args.app_sessions):
+        uid = rng.choice(users)
+        at = new_app()
+        at.query_params["uid"] = uid
+        at.run()
+        for _ in range(rng.randint(1, 3)):
+            taps = rng.choices(TAPS, k=rng.randint(1, 3))
+            send_value(at, "intake_buttons", tap_batch(at, *taps))
+            added[uid] += sum(taps)
+
+
+def replica(index, args, paths, barrier, results):
+    store = ShardedStore(paths)
+    registry = SessionRegistry(store)
+    added, removed, lock, errors = Counter(), Counter(), threading.Lock(), []
+    start = time.perf_counter()
+    threads = [threading.Thread(target=hammer, args=(registry, args, args.seed * 1_000_003 + index * 1000 + t,
+                                                     added, removed, lock, errors))
+               for t in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    seconds = time.perf_counter() - start
+    writes = store.writes
+    if args.app_sessions:
+        app_sessions(args, index, added)
+    barrier.wait()
+    view = {}
+    for uid in user_ids(args.users):
+        rec = registry.get(uid)
+        view[uid] = (rec.version, rec.intake_log.total, list(rec.intake_log.amounts))
+    results.put({"index": index, "added": added, "removed": removed, "seconds": seconds, "view": view,
+                 "writes": writes, "errors": errors, "conflicts": registry.conflicts, "reloads": registry.reloads})
+    store.close()
+
+
+def seed_users(paths, users):
+    store = ShardedStore(paths)
+    condition = get_rules().conditions[0]
+    for uid in user_ids(users):
+        store.save_profile(uid, 30, 170, 65, condition, 2000)
+    store.close()
+
+
+def shard_state(store, uid):
+    """(version, current-day total, every event's ml) straight from the user's shard."""
+    conn = sqlite3.connect(store.shard_for(uid))
+    try:
+        version = conn.execute("SELECT version FROM user_versions WHERE user_id = ?", (uid,)).fetchone()[0]
+        day = conn.execute("SELECT current_day FROM profiles WHERE user_id = ?", (uid,)).fetchone()[0]
+        events = conn.execute("SELECT day, ml FROM intake_events WHERE user_id = ? ORDER BY rowid",
+                              (uid,)).fetchall()
+    finally:
+        conn.close()
+    # IntakeLog.from_events opens every day up to the highest one it sees
+    day = max([day] + [d for d, _ in events])
+    return version, sum(ml for d, ml in events if d == day), [ml for _, ml in events]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exact totals across replica processes sharing shard files")
+    parser.add_argument("--replicas", type=int, default=4)
+    parser.add_argument("--shards", type=int, default=4)
+    parser.add_argument("--users", type=int, default=12, help="few users, so replicas collide often")
+    parser.add_argument("--threads", type=int, default=4, help="sessions per replica")
+    parser.add_argument("--ops", type=int, default=500, help="operations per thread")
+    parser.add_argument("--app-sessions", type=int, default=5, help="AppTest sessions per replica")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = [os.path.join(tmp, f"shard-{i}.db") for i in range(args.shards)]
+        seed_users(paths, args.users)
+        os.environ[SHARDS_ENV_VAR] = ",".join(paths)
+
+        context = multiprocessing.get_context("spawn")
+        barrier, results = context.Barrier(args.replicas), context.Queue()
+        processes = [context.Process(target=replica, args=(i, args, paths, barrier, results))
+                     for i in range(args.replicas)]
+        for process in processes:
+            process.start()
+        reports = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+            if process.exitcode:
+                sys.exit(f"FAIL: a replica exited with code {process.exitcode}")
+
+        added = sum((r["added"] for r in reports), Counter())
+        removed = sum((r["removed"] for r in reports), Counter())
+        store = ShardedStore(paths)
+        failures = [f"replica {r['index']}: {error}" for r in reports for error in r["errors"]]
+        for uid in user_ids(args.users):
+            state = shard_state(store, uid)
+            if sum(state[2]) != added[uid] - removed[uid]:
+                failures.append(f"{uid}: stored {sum(state[2])} ml, expected {added[uid]} - {removed[uid]}")
+            for report in reports:
+                if tuple(report["view"][uid]) != state:
+                    failures.append(f"{uid}: replica {report['index']} sees {report['view'][uid][:2]}, "
+                                    f"shard has {state[:2]}")
+        spread = Counter(Path(store.shard_for(uid)).name for uid in user_ids(args.users))
+        store.close()
+
+    writes = sum(r["writes"] for r in reports)
+    seconds = max(r["seconds"] for r in reports)
+    print(f"{args.replicas} replicas x {args.threads} threads over {args.shards} shards "
+          f"({', '.join(f'{n}: {c}' for n, c in sorted(spread.items()))} users)")
+    print(f"{writes:,} committed writes in {seconds:.2f}s ({writes / seconds:,.0f}/s across replicas), "
+          f"{sum(r['conflicts'] for r in reports):,} version conflicts retried, "
+          f"{sum(r['reloads'] for r in reports):,} stale cache reloads")
+    if failures:
+        sys.exit("FAIL:\n  " + "\n  ".join(failures[:20]))
+    print(f"verified {args.users} users: stored totals exact and every replica's cache matches its shard")
+
+
+if __name__ == "__main__":
+    main()
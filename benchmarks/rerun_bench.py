@@ -0,0 +1,162 @@
+"""Rerun cost of every page and button in the app's step state machine.
+
+For each page (``input``, ``summary``, ``tracking``, ``reset_confirm``, and
+the ``?admin=<token>`` dashboard) the suite measures a plain rerun, and for each button on it the rerun that the
+click triggers: script-run wall time, elements emitted and serialized delta
+bytes.  A batch of taps from the intake buttons component counts as a click.
+Clicks on widgets inside a fragment are replayed as fragment reruns.
+
+Results are compared with ``baselines/reruns.json``.  Element counts and
+bytes are deterministic and fail the run when they grow by more than
+``--threshold``; wall time is noisier and gets its own, looser
+``--time-threshold``.
+
+    python benchmarks/rerun_bench.py            # compare against the baseline
+    python benchmarks/rerun_bench.py --update   # record a new baseline
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+from apptest_harness import (
+    RunCapture,
+    delta_stats,
+    new_app,
+    quiet_app_env,
+    send_value,
+    tap_batch,
+    to_reset_confirm,
+    to_summary,
+    to_tracking,
+)
+
+BASELINE = Path(__file__).resolve().parent / "baselines" / "reruns.json"
+DETERMINISTIC = ("elements", "delta_messages", "delta_bytes")
+ADMIN_TOKEN = "rerun-bench"
+
+
+def _input(at):
+    return at.run()
+
+
+def _admin(at):
+    os.environ["WATERBUDDY_ADMIN_TOKEN"] = ADMIN_TOKEN
+    at.query_params["admin"] = ADMIN_TOKEN
+    return at.run()
+
+
+def _tracking_with_custom(at):
+    to_tracking(at)
+    at.text_input(key="custom_amount_input").set_value("300")
+    return at
+
+
+def _tracking_with_drink(at):
+    to_tracking(at)
+    send_value(at, "intake_buttons", tap_batch(at, 250))
+    return at
+
+
+# name -> (how to reach the page, button key to click, amounts tapped on the
+# intake buttons component as one batch, or None for a plain rerun)
+SCENARIOS = {
+    "input": (_input, None),
+    "input:submit": (_input, "FormSubmitter:input_form-Calculate My Goal →"),
+    "summary": (to_summary, None),
+    "summary:back_from_summary": (to_summary, "back_from_summary"),
+    "summary:start_tracking": (to_summary, "start_tracking"),
+    "tracking": (to_tracking, None),
+    "tracking:tap_250": (to_tracking, (250,)),
+    "tracking:tap_batch": (to_tracking, (250, 250, 500)),
+    "tracking:add_custom": (_tracking_with_custom, "add_custom"),
+    "tracking:undo_intake": (_tracking_with_drink, "undo_intake"),
+    "tracking:tip_click": (to_tracking, "tip_click"),
+    "tracking:reset_tracking": (to_tracking, "reset_tracking"),
+    "tracking:edit_profile": (to_tracking, "edit_profile"),
+    "reset_confirm": (to_reset_confirm, None),
+    "reset_confirm:cancel_reset": (to_reset_confirm, "cancel_reset"),
+    "reset_confirm:confirm_reset": (to_reset_confirm, "confirm_reset"),
+    "admin": (_admin, None),
+    "admin:refresh_admin": (_admin, "refresh_admin"),
+}
+
+
+def run_scenario(setup, key, repeats):
+    times = []
+    with RunCapture() as capture:
+        for _ in range(repeats):
+            at = setup(new_app())
+            if key is None:
+                start = time.perf_counter()
+                at.run()
+                times.append(time.perf_counter() - start)
+            elif isinstance(key, tuple):
+                elapsed, _ = capture.send(at, "intake_buttons", tap_batch(at, *key))
+                times.append(elapsed)
+            else:
+                elapsed, _ = capture.click(at, key)
+                times.append(elapsed)
+            if at.exception:
+                raise RuntimeError(at.exception[0].message)
+        stats = delta_stats(capture.runs[-1])
+    return {
+        "wall_ms": round(statistics.median(times) * 1000, 3),
+        "elements": stats["elements"],
+        "delta_messages": stats["delta_messages"],
+        "delta_bytes": stats["delta_bytes"],
+    }
+
+
+def compare(results, baseline, threshold, time_threshold):
+    failures = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        for metric in DETERMINISTIC:
+            if result[metric] > base[metric] * (1 + threshold):
+                failures.append(f"{name}: {metric} {base[metric]} -> {result[metric]}")
+        if result["wall_ms"] > base["wall_ms"] * (1 + time_threshold):
+            failures.append(f"{name}: wall_ms {base['wall_ms']} -> {result['wall_ms']}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-page and per-button rerun benchmarks")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--threshold", type=float, default=0.10, help="allowed growth of elements/bytes")
+    parser.add_argument("--time-threshold", type=float, default=1.0, help="allowed growth of wall time")
+    parser.add_argument("--only", help="run scenarios whose name starts with this prefix")
+    parser.add_argument("--update", action="store_true", help="write the results as the new baseline")
+    args = parser.parse_args()
+
+    scenarios = {name: s for name, s in SCENARIOS.items() if not args.only or name.startswith(args.only)}
+    results = {}
+    with quiet_app_env():
+        for name, (setup, key) in scenarios.items():
+            results[name] = run_scenario(setup, key, args.repeats)
+            r = results[name]
+            print(f"{name:32} {r['wall_ms']:8.2f} ms {r['elements']:4d} elements {r['delta_bytes']:7d} bytes")
+
+    if args.update:
+        baseline = json.loads(BASELINE.read_text()) if BASELINE.exists() else {}
+        baseline.update(results)
+        BASELINE.write_text(json.dumps(baseline, indent=2, sort_keys=True) + "\n")
+        print(f"baseline written to {BASELINE}")
+        return
+    if not BASELINE.exists():
+        sys.exit(f"no baseline at {BASELINE}; run with --update first")
+    failures = compare(results, json.loads(BASELINE.read_text()), args.threshold, args.time_threshold)
+    if failures:
+        print("\nREGRESSIONS:\n  " + "\n  ".join(failures))
+        sys.exit(1)
+    print("\nno regressions against baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""Bytes of Python heap held per user session.
+
+    python benchmarks/session_memory.py --sessions 10000 --drinks 8
+
+Builds ``--sessions`` users who have filled in a profile and logged
+``--drinks`` intakes today, once as the ``SessionRecord`` entries of a
+``SessionRegistry`` and once as the loose ``st.session_state`` keys the app
+used before, and reports tracemalloc's bytes per session for each.  It then
+lets every record go idle past the TTL and reports what the registry still
+holds after eviction.
+"""
+
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import tracemalloc
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from streamlit.runtime.state.session_state import SessionState  # noqa: E402
+
+from waterbuddy.core import goal_breakdown  # noqa: E402
+from waterbuddy.intake import IntakeLog  # noqa: E402
+from waterbuddy.rules import get_rules  # noqa: E402
+from waterbuddy.session import SessionRegistry  # noqa: E402
+from waterbuddy.storage import Store  # noqa: E402
+
+
+def profile(i):
+    age, height, weight = 18 + i % 60, 150 + i % 50, 50 + i % 60
+    condition = get_rules().conditions[i % len(get_rules().conditions)]
+    return age, height, weight, condition, goal_breakdown(age, height, weight, condition)
+
+
+def fill_log(log, drinks):
+    for d in range(drinks):
+        log.append(250, 1_700_000_000.0 + d * 900)
+
+
+def traced():
+    return tracemalloc.get_traced_memory()[0]
+
+
+def build_registry(registry, user_ids, drinks):
+    for i, user_id in enumerate(user_ids):
+        rec = registry.get(user_id)
+        age, height, weight, condition, breakdown = profile(i)
+        rec.set_profile(age, height, weight, condition)
+        rec.goal = breakdown["goal"]
+        rec.step = "tracking"
+        fill_log(rec.intake_log, drinks)
+    return registry
+
+
+def build_session_states(user_ids, drinks):
+    states = []
+    for i, user_id in enumerate(user_ids):
+        state = SessionState()
+        age, height, weight, condition, breakdown = profile(i)
+        log = IntakeLog()
+        fill_log(log, drinks)
+        for key, value in (("user_id", user_id), ("step", "tracking"), ("age", age), ("height", height),
+                           ("weight", weight), ("condition", condition), ("bmi", breakdown["bmi"]),
+                           ("bmi_cat", breakdown["bmi_category"]), ("goal", breakdown["goal"]),
+                           ("show_tip", False), ("intake_log", log)):
+            state[key] = value
+        states.append(state)
+    return states
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-session memory of the session registry")
+    parser.add_argument("--sessions", type=int, default=10_000)
+    parser.add_argument("--drinks", type=int, default=8, help="intakes logged today per user")
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)  # SessionState warns about the missing script context
+
+    n = args.sessions
+    user_ids = [uuid.uuid4().hex for _ in range(n)]
+    now = [0.0]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = Store(os.path.join(tmp, "sessions.db"))
+        registry = SessionRegistry(store, max_sessions=n, ttl=60, clock=lambda: now[0])
+        tracemalloc.start()
+        start = traced()
+        build_registry(registry, user_ids, args.drinks)
+        record_bytes = traced() - start
+
+        start = traced()
+        states = build_session_states(user_ids, args.drinks)
+        state_bytes = traced() - start
+
+        now[0] = 3600.0
+        start = traced()
+        evicted = registry.evict_idle()
+        freed = start - traced()
+        tracemalloc.stop()
+        store.close()
+
+    print(f"{n} sessions, {args.drinks} drinks each")
+    print(f"  SessionRecord in registry  {record_bytes / n:8.0f} bytes/session")
+    print(f"  st.session_state keys      {state_bytes / n:8.0f} bytes/session")
+    print(f"  evicted after idle TTL     {evicted} sessions, {freed / n:8.0f} bytes/session freed, "
+          f"{len(registry)} left")
+    del states
+
+
+if __name__ == "__main__":
+    main()
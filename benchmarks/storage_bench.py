@@ -0,0 +1,135 @@
+"""Throughput and crash-recovery check for waterbuddy.storage.
+
+    python benchmarks/storage_bench.py                # sustained inserts/sec
+    python benchmarks/storage_bench.py --crash-check  # kill -9 a writer, verify recovery
+
+The throughput run has ``--users`` threads, each standing in for a session
+tapping "+250 ml" as fast as it can.  It reports committed events per second
+for the group-committed store and, for comparison, for one commit per insert.
+
+The crash check runs a writer in a child process and sends SIGKILL while it
+is mid-stream.  Every event the child saw acknowledged by ``flush()`` must be
+present after reopening, and SQLite's integrity check must pass.
+"""
+
+import argparse
+import os
+import signal
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from waterbuddy.storage import Store  # noqa: E402
+
+
+def count_events(path):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("SELECT COUNT(*) FROM intake_events").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def group_commit_rate(path, users, seconds):
+    store = Store(path)
+    stop = threading.Event()
+
+    def tap(user_id):
+        while not stop.is_set():
+            store.record_intake(user_id, 0, time.time(), 250)
+            time.sleep(0)
+
+    threads = [threading.Thread(target=tap, args=(f"user-{i}",)) for i in range(users)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    store.flush()
+    elapsed = time.perf_counter() - start
+    store.close()
+    return count_events(path) / elapsed
+
+
+def per_insert_commit_rate(path, seconds):
+    store = Store(path)
+    store.close()
+    conn = sqlite3.connect(path, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=FULL")
+    n = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        conn.execute("INSERT INTO intake_events (user_id, day, ts, ml) VALUES (?, 0, ?, 250)", ("user", time.time()))
+        n += 1
+    elapsed = time.perf_counter() - start
+    conn.close()
+    return n / elapsed
+
+
+def crash_child(path):
+    store = Store(path, flush_interval=0.01)
+    written = 0
+    while True:
+        for _ in range(100):
+            store.record_intake("user", 0, time.time(), 250)
+            written += 1
+        store.flush()
+        print(written, flush=True)
+
+
+def crash_check(path, run_for):
+    child = subprocess.Popen([sys.executable, __file__, "--crash-child", path], stdout=subprocess.PIPE, text=True)
+    acked = 0
+    deadline = time.monotonic() + run_for
+    for line in child.stdout:
+        acked = int(line)
+        if time.monotonic() >= deadline:
+            break
+    child.send_signal(signal.SIGKILL)
+    child.wait()
+
+    store = Store(path)
+    store.close()
+    recovered = count_events(path)
+    conn = sqlite3.connect(path)
+    integrity = conn.execute("PRAGMA integrity_check").fetchone()[0]
+    conn.close()
+    print(f"acknowledged before kill: {acked}, recovered: {recovered}, integrity: {integrity}")
+    if recovered < acked or integrity != "ok":
+        sys.exit("crash check FAILED")
+    print("crash check passed")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=32)
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--crash-check", action="store_true")
+    parser.add_argument("--crash-child", metavar="DB", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.crash_child:
+        crash_child(args.crash_child)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.crash_check:
+            crash_check(os.path.join(tmp, "crash.db"), args.seconds)
+            return
+        grouped = group_commit_rate(os.path.join(tmp, "grouped.db"), args.users, args.seconds)
+        single = per_insert_commit_rate(os.path.join(tmp, "single.db"), args.seconds)
+        print(f"group commit, {args.users} users: {grouped:,.0f} inserts/sec")
+        print(f"commit per insert:          {single:,.0f} inserts/sec")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""Delta messages and bytes sent to the browser per tracking-page click.
+
+Drives ``app.py`` through Streamlit's in-process ``AppTest`` harness up to
+the tracking page, then sends a single tap and a batch of taps from the intake
+buttons component and clicks the custom "Add" button, reporting what each
+resulting rerun puts on the websocket.  When the clicked widget lives in a
+fragment the click is replayed as a fragment rerun, the way the browser
+would send it.
+
+    python benchmarks/tracking_deltas.py
+"""
+
+import json
+import sys
+
+from apptest_harness import RunCapture, delta_stats, new_app, quiet_app_env, tap_batch, to_tracking
+
+TAPS = {"tap_250": (250,), "tap_batch": (250, 250, 500)}
+
+
+def measure():
+    results = {}
+    browser_cache = set()
+    with RunCapture() as capture:
+        at = to_tracking(new_app())
+        for msgs in capture.runs[:-1]:
+            delta_stats(msgs, browser_cache)
+        results["tracking_full_rerun"] = dict(delta_stats(capture.runs[-1], browser_cache), fragment=False)
+        for name, amounts in TAPS.items():
+            _, fragment_id = capture.send(at, "intake_buttons", tap_batch(at, *amounts))
+            results[name] = dict(delta_stats(capture.runs[-1], browser_cache), fragment=bool(fragment_id))
+        at.text_input(key="custom_amount_input").set_value("100")
+        _, fragment_id = capture.click(at, "add_custom")
+        results["add_custom"] = dict(delta_stats(capture.runs[-1], browser_cache), fragment=bool(fragment_id))
+        at.run()
+        results["tracking_full_rerun_repeat"] = dict(delta_stats(capture.runs[-1], browser_cache), fragment=False)
+    return results
+
+
+def main():
+    with quiet_app_env():
+        json.dump(measure(), sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
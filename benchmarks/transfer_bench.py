@@ -0,0 +1,223 @@
+"""Export/import throughput and memory for waterbuddy.transfer.
+
+    python benchmarks/transfer_bench.py --events 1000000
+    python benchmarks/transfer_bench.py --events 1000000 --resume-check
+
+Fills a scratch database with ``--users`` profiles and ``--events`` intake
+events, then exports it as CSV and as ``.wbc`` and imports each backup into
+an empty database.  Every step runs the real CLI in a child process and
+reports rows/sec, file size and the child's peak RSS, which should stay
+roughly the same as ``--events`` grows.
+
+``--resume-check`` kills an import with SIGKILL part way, runs it again and
+checks that the result matches the source exactly: same event count, same
+ml total, nothing duplicated.
+
+Either way the run first saves profiles through the HTTP API's handler,
+checks that a fractional height is refused, and round-trips the result
+through both formats, which must give back the same profile rows with the
+same column types.  It then changes the last profile's goal, exports again
+and checks that importing the newer backup over the first picks it up.  A stored fractional height (as older API versions
+wrote) must make the ``.wbc`` export fail with an error message rather
+than a traceback.
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import signal
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from waterbuddy.api import HTTPError, HydrationAPI  # noqa: E402
+from waterbuddy.rules import get_rules  # noqa: E402
+from waterbuddy.storage import SCHEMA, Store  # noqa: E402
+from waterbuddy.transfer import TABLES  # noqa: E402
+
+CONDITIONS = ("Normal / Healthy", "Diabetes", "Kidney Issues", "Pregnant")
+
+
+def populate(path, users, events, seed=0):
+    rng = random.Random(seed)
+    ids = [f"{rng.getrandbits(128):032x}" for _ in range(users)]
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.executescript(SCHEMA)
+    conn.executemany(
+        "INSERT INTO profiles VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        ((uid, rng.randint(5, 90), rng.randint(110, 200), rng.randint(20, 140), rng.choice(CONDITIONS),
+          rng.choice((1700, 2200, 2500)), 0, 1.7e9) for uid in ids),
+    )
+    start = 1.7e9
+    conn.executemany(
+        "INSERT INTO intake_events VALUES (?, ?, ?, ?)",
+        ((ids[rng.randrange(users)], i * 30 // events, start + i * 0.5, rng.choice((250, 500, 330)))
+         for i in range(events)),
+    )
+    conn.commit()
+    conn.close()
+
+
+def totals(path):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("SELECT COUNT(*), COALESCE(SUM(ml), 0) FROM intake_events").fetchone()
+    finally:
+        conn.close()
+
+
+def run_cli(*args):
+    """Run the transfer CLI; returns (seconds, peak RSS in MiB)."""
+    start = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "-m", "waterbuddy.transfer", *args], cwd=ROOT,
+                            stdout=subprocess.DEVNULL)
+    _, status, usage = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    if proc.returncode:
+        sys.exit(f"transfer {' '.join(args)} failed with {proc.returncode}")
+    return time.perf_counter() - start, usage.ru_maxrss / 1024
+
+
+def dir_size(path):
+    return sum(f.stat().st_size for f in Path(path).iterdir())
+
+
+def throughput(tmp, rows, chunk_size):
+    db = os.path.join(tmp, "source.db")
+    for fmt in ("csv", "wbc"):
+        out = os.path.join(tmp, f"backup-{fmt}")
+        seconds, rss = run_cli("export", db, out, "--format", fmt, "--chunk-size", str(chunk_size))
+        print(f"export {fmt:3}  {rows / seconds:12,.0f} rows/s  {dir_size(out) / 2**20:8.1f} MiB  "
+              f"peak RSS {rss:6.1f} MiB")
+        target = os.path.join(tmp, f"import-{fmt}.db")
+        seconds, rss = run_cli("import", out, target, "--chunk-size", str(chunk_size))
+        print(f"import {fmt:3}  {rows / seconds:12,.0f} rows/s  {'':8}      "
+              f"peak RSS {rss:6.1f} MiB")
+        if totals(target) != totals(db):
+            sys.exit(f"FAIL: {fmt} round trip changed the events: {totals(target)} != {totals(db)}")
+
+
+def profile_rows(path):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute(
+            "SELECT user_id, age, typeof(age), height, typeof(height), weight, typeof(weight), condition, goal "
+            "FROM profiles ORDER BY user_id").fetchall()
+    finally:
+        conn.close()
+
+
+async def save_profiles(api, count, seed):
+    rng = random.Random(seed)
+    conditions = get_rules().conditions
+    for i in range(count):
+        profile = {"age": rng.randint(1, 120), "height": rng.randint(1, 300), "weight": rng.randint(1, 500),
+                   "condition": rng.choice(conditions)}
+        await api.put_profile(f"api-{i}", profile)
+    try:
+        await api.put_profile("api-float", {"age": 30, "height": 170.5, "weight": 65})
+    except HTTPError:
+        return
+    sys.exit("FAIL: the API accepted a fractional height")
+
+
+def profile_round_trip(tmp, count=2000):
+    db = os.path.join(tmp, "api.db")
+    store = Store(db)
+    asyncio.run(save_profiles(HydrationAPI(store), count, seed=1))
+    store.close()
+    expected = profile_rows(db)
+    if len(expected) != count:
+        sys.exit(f"FAIL: {len(expected)} profiles saved through the API, expected {count}")
+    for fmt in ("csv", "wbc"):
+        out = os.path.join(tmp, f"api-backup-{fmt}")
+        target = os.path.join(tmp, f"api-import-{fmt}.db")
+        run_cli("export", db, out, "--format", fmt)
+        run_cli("import", out, target)
+        if profile_rows(target) != expected:
+            sys.exit(f"FAIL: {fmt} round trip changed the profiles saved through the API")
+
+    # A newer backup of the same size that differs only near its end must
+    # still be imported, not taken for the one already in.
+    conn = sqlite3.connect(db)
+    uid, goal = conn.execute("SELECT user_id, goal FROM profiles ORDER BY rowid DESC LIMIT 1").fetchone()
+    conn.execute("UPDATE profiles SET goal = ? WHERE user_id = ?", (goal + 100, uid))
+    conn.commit()
+    conn.close()
+    expected = profile_rows(db)
+    for fmt in ("csv", "wbc"):
+        out = os.path.join(tmp, f"api-backup-{fmt}")
+        size = dir_size(out)
+        run_cli("export", db, out, "--format", fmt)
+        run_cli("import", out, os.path.join(tmp, f"api-import-{fmt}.db"))
+        if profile_rows(os.path.join(tmp, f"api-import-{fmt}.db")) != expected:
+            sys.exit(f"FAIL: a newer {fmt} backup ({size} -> {dir_size(out)} bytes) was not imported")
+
+    conn = sqlite3.connect(db)
+    conn.execute("UPDATE profiles SET height = 170.5 WHERE user_id = 'api-0'")
+    conn.commit()
+    conn.close()
+    proc = subprocess.run([sys.executable, "-m", "waterbuddy.transfer", "export", db, os.path.join(tmp, "legacy"),
+                           "--format", "wbc"], cwd=ROOT, capture_output=True, text=True)
+    if proc.returncode == 0 or not proc.stderr.startswith("error: profiles.height"):
+        sys.exit(f"FAIL: exporting a fractional height gave {proc.returncode}: {proc.stderr.strip()}")
+    print(f"{count} API profiles round-tripped through csv and wbc, newer backups re-imported; "
+          "fractional heights refused")
+
+
+def resume_check(tmp, kill_after):
+    db = os.path.join(tmp, "source.db")
+    out = os.path.join(tmp, "backup-resume")
+    run_cli("export", db, out, "--format", "wbc", "--chunk-size", "4096")
+    target = os.path.join(tmp, "resume.db")
+    proc = subprocess.Popen([sys.executable, "-m", "waterbuddy.transfer", "import", out, target], cwd=ROOT,
+                            stdout=subprocess.DEVNULL)
+    time.sleep(kill_after)
+    proc.send_signal(signal.SIGKILL)
+    proc.wait()
+    partial = totals(target)
+    run_cli("import", out, target)
+    final, expected = totals(target), totals(db)
+    print(f"killed after {kill_after}s with {partial[0]:,} events in; after resume {final[0]:,} of {expected[0]:,}")
+    if final != expected:
+        sys.exit(f"FAIL: resumed import has {final}, source has {expected}")
+    conn = sqlite3.connect(target)
+    check = conn.execute("PRAGMA integrity_check").fetchone()[0]
+    conn.close()
+    if check != "ok":
+        sys.exit(f"FAIL: integrity check: {check}")
+    print("resume OK")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput of streaming export/import")
+    parser.add_argument("--users", type=int, default=20_000)
+    parser.add_argument("--events", type=int, default=1_000_000)
+    parser.add_argument("--chunk-size", type=int, default=65_536)
+    parser.add_argument("--resume-check", action="store_true", help="kill an import part way and resume it")
+    parser.add_argument("--kill-after", type=float, default=1.0, help="seconds before the kill in --resume-check")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        profile_round_trip(tmp)
+        start = time.perf_counter()
+        populate(os.path.join(tmp, "source.db"), args.users, args.events)
+        print(f"{args.users:,} profiles and {args.events:,} events generated in {time.perf_counter() - start:.1f}s "
+              f"({', '.join(TABLES)})")
+        if args.resume_check:
+            resume_check(tmp, args.kill_after)
+        else:
+            throughput(tmp, args.users + args.events, args.chunk_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""WaterBuddy hydration logic that can run outside the Streamlit UI.
+
+Names are imported from their submodules on first access, so
+``import waterbuddy`` stays cheap and never pulls in NumPy or SQLite
+unless the batch engine or the store is actually used.
+"""
+
+import importlib
+
+_EXPORTS = {
+    "calculate_bmi": "waterbuddy.core",
+    "bmi_category": "waterbuddy.core",
+    "base_goal_by_age": "waterbuddy.core",
+    "health_condition_adjustment": "waterbuddy.core",
+    "bmi_adjustment": "waterbuddy.core",
+    "emoji_for_progress": "waterbuddy.core",
+    "goal_breakdown": "waterbuddy.core",
+    "progress_percent": "waterbuddy.core",
+    "GoalIndex": "waterbuddy.goal_index",
+    "get_goal_index": "waterbuddy.goal_index",
+    "get_rules": "waterbuddy.rules",
+    "load_rules": "waterbuddy.rules",
+    "RuleTableError": "waterbuddy.rules",
+    "IntakeLog": "waterbuddy.intake",
+    "DayHistory": "waterbuddy.history",
+    "PopulationStats": "waterbuddy.analytics",
+    "ReminderScheduler": "waterbuddy.reminders",
+    "SessionRecord": "waterbuddy.session",
+    "SessionRegistry": "waterbuddy.session",
+    "Store": "waterbuddy.storage",
+    "ShardedStore": "waterbuddy.sharding",
+    "compute_goals": "waterbuddy.batch",
+    "export_db": "waterbuddy.transfer",
+    "import_db": "waterbuddy.transfer",
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    try:
+        module = _EXPORTS[name]
+    except KeyError:
+        raise AttributeError(f"module 'waterbuddy' has no attribute {name!r}") from None
+    value = getattr(importlib.import_module(module), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,351 @@
+"""Live population statistics over the users a process is serving.
+
+``PopulationStats`` remembers each active user's last goal, intake and BMI
+category and keeps running totals over all of them:
+
+- a histogram of progress over the same buckets ``emoji_for_progress`` uses
+- counts per BMI category
+- goal and intake sums
+- quantile sketches of goal, intake and progress
+
+``observe`` swaps a user's old contribution for the new one and ``forget``
+takes it out, both O(1), so nothing ever scans the sessions and a
+``Snapshot`` costs the same to take and render for ten users as for a
+million.
+
+A snapshot is nothing but counts, so snapshots from several processes
+``merge`` into exactly what one process serving everyone would report.
+Each process can ``publish`` its snapshot as a JSON file in a shared
+directory (``WATERBUDDY_ANALYTICS_DIR``), and ``merge_snapshot_files``
+combines the fresh ones.
+"""
+
+import json
+import logging
+import math
+import os
+import socket
+import threading
+import time
+from pathlib import Path
+
+from waterbuddy.core import progress_percent
+from waterbuddy.rules import get_rules
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 1
+DEFAULT_ALPHA = 0.01
+SKETCHES = ("goal", "intake", "progress")
+PUBLISH_INTERVAL = 15.0
+MAX_SNAPSHOT_AGE = 5 * 60
+
+
+class QuantileSketch:
+    """DDSketch-style quantiles with relative error ``alpha``.
+
+    A positive value ``x`` is counted in bin ``ceil(log_gamma(x))`` with
+    ``gamma = (1 + alpha) / (1 - alpha)``; zero and negative values share one
+    zero bin.  A quantile is reported as the midpoint of its bin, which is
+    within ``alpha`` of the true value relative to it.  Bins only hold
+    counts, so sketches with the same ``alpha`` merge exactly and a value is
+    taken back out by adding it with ``count=-1``.
+    """
+
+    __slots__ = ("alpha", "count", "zero", "bins", "_log_gamma")
+
+    def __init__(self, alpha=DEFAULT_ALPHA):
+        if not 0 < alpha < 1:
+            raise ValueError(f"alpha must be between 0 and 1, got {alpha!r}")
+        self.alpha = alpha
+        self.count = 0
+        self.zero = 0
+        self.bins = {}
+        self._log_gamma = math.log((1 + alpha) / (1 - alpha))
+
+    def add(self, x, count=1):
+        self.count += count
+        if x <= 0:
+            self.zero += count
+            return
+        key = math.ceil(math.log(x) / self._log_gamma)
+        n = self.bins.get(key, 0) + count
+        if n:
+            self.bins[key] = n
+        else:
+            del self.bins[key]
+
+    def quantile(self, q):
+        """Estimated ``q``-quantile (0 <= q <= 1), or ``None`` if empty."""
+        if not 0 <= q <= 1:
+            raise ValueError(f"q must be between 0 and 1, got {q!r}")
+        if self.count <= 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zero
+        if rank < seen:
+            return 0.0
+        gamma = math.exp(self._log_gamma)
+        key = None
+        for key in sorted(self.bins):
+            seen += self.bins[key]
+            if rank < seen:
+                break
+        return 2 * gamma ** key / (gamma + 1)
+
+    def merge(self, other):
+        if other.alpha != self.alpha:
+            raise ValueError(f"cannot merge sketches with alpha {self.alpha} and {other.alpha}")
+        self.count += other.count
+        self.zero += other.zero
+        bins = self.bins
+        for key, n in other.bins.items():
+            n += bins.get(key, 0)
+            if n:
+                bins[key] = n
+            else:
+                bins.pop(key, None)
+        return self
+
+    def copy(self):
+        return QuantileSketch(self.alpha).merge(self)
+
+    def to_dict(self):
+        return {"alpha": self.alpha, "count": self.count, "zero": self.zero,
+                "bins": sorted(self.bins.items())}
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data["alpha"])
+        sketch.count = data["count"]
+        sketch.zero = data["zero"]
+        sketch.bins = {int(key): n for key, n in data["bins"]}
+        return sketch
+
+
+class Snapshot:
+    """Population totals at one moment, from one or more processes."""
+
+    __slots__ = ("users", "goal_sum", "intake_sum", "progress_bounds", "progress_labels", "progress",
+                 "bmi", "sketches", "processes", "taken_at")
+
+    def __init__(self, progress_bounds, progress_labels, bmi_categories=(), alpha=DEFAULT_ALPHA):
+        self.users = 0
+        self.goal_sum = 0
+        self.intake_sum = 0
+        self.progress_bounds = tuple(progress_bounds)
+        self.progress_labels = tuple(progress_labels)
+        self.progress = [0] * (len(self.progress_bounds) + 1)
+        self.bmi = dict.fromkeys(bmi_categories, 0)
+        self.sketches = {name: QuantileSketch(alpha) for name in SKETCHES}
+        self.processes = 1
+        self.taken_at = 0.0
+
+    @classmethod
+    def empty(cls, rules=None, alpha=DEFAULT_ALPHA):
+        rules = rules or get_rules()
+        return cls(rules.progress.bounds, [emoji for emoji, _ in rules.progress.values],
+                   rules.bmi_categories, alpha)
+
+    @property
+    def mean_goal(self):
+        return self.goal_sum / self.users if self.users else 0
+
+    @property
+    def mean_intake(self):
+        return self.intake_sum / self.users if self.users else 0
+
+    def quantile(self, name, q):
+        return self.sketches[name].quantile(q)
+
+    def progress_ranges(self):
+        """``(label, low, high, count)`` per progress bucket, in percent."""
+        lows = (0,) + self.progress_bounds
+        highs = tuple(b - 1 for b in self.progress_bounds) + (100,)
+        return list(zip(self.progress_labels, lows, highs, self.progress))
+
+    def merge(self, other):
+        """Add ``other``'s totals into this snapshot and return it."""
+        if other.progress_bounds != self.progress_bounds:
+            raise ValueError("cannot merge snapshots taken with different progress buckets")
+        self.users += other.users
+        self.goal_sum += other.goal_sum
+        self.intake_sum += other.intake_sum
+        self.progress = [a + b for a, b in zip(self.progress, other.progress)]
+        for category, n in other.bmi.items():
+            self.bmi[category] = self.bmi.get(category, 0) + n
+        for name, sketch in other.sketches.items():
+            self.sketches[name].merge(sketch)
+        self.processes += other.processes
+        self.taken_at = max(self.taken_at, other.taken_at)
+        return self
+
+    def copy(self):
+        snapshot = Snapshot(self.progress_bounds, self.progress_labels)
+        snapshot.users = self.users
+        snapshot.goal_sum = self.goal_sum
+        snapshot.intake_sum = self.intake_sum
+        snapshot.progress = list(self.progress)
+        snapshot.bmi = dict(self.bmi)
+        snapshot.sketches = {name: sketch.copy() for name, sketch in self.sketches.items()}
+        snapshot.processes = self.processes
+        snapshot.taken_at = self.taken_at
+        return snapshot
+
+    def to_dict(self):
+        return {
+            "version": SNAPSHOT_VERSION,
+            "taken_at": self.taken_at,
+            "processes": self.processes,
+            "users": self.users,
+            "goal_sum": self.goal_sum,
+            "intake_sum": self.intake_sum,
+            "progress": {"bounds": list(self.progress_bounds), "labels": list(self.progress_labels),
+                         "counts": self.progress},
+            "bmi": self.bmi,
+            "sketches": {name: sketch.to_dict() for name, sketch in self.sketches.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        if data.get("version") != SNAPSHOT_VERSION:
+            raise ValueError(f"unsupported snapshot version {data.get('version')!r}")
+        progress = data["progress"]
+        if len(progress["counts"]) != len(progress["bounds"]) + 1:
+            raise ValueError("progress counts do not match the bounds")
+        snapshot = cls(progress["bounds"], progress["labels"])
+        snapshot.users = data["users"]
+        snapshot.goal_sum = data["goal_sum"]
+        snapshot.intake_sum = data["intake_sum"]
+        snapshot.progress = list(progress["counts"])
+        snapshot.bmi = dict(data["bmi"])
+        snapshot.sketches = {name: QuantileSketch.from_dict(s) for name, s in data["sketches"].items()}
+        snapshot.processes = data["processes"]
+        snapshot.taken_at = data["taken_at"]
+        return snapshot
+
+
+class PopulationStats:
+    """Running totals over every user observed and not yet forgotten.
+
+    One instance is shared by all sessions of a process; every method is
+    thread-safe.
+    """
+
+    def __init__(self, rules=None, alpha=DEFAULT_ALPHA, clock=time.time):
+        self.rules = rules or get_rules()
+        self.clock = clock
+        self._totals = Snapshot.empty(self.rules, alpha)
+        # user id -> (goal, intake, bmi category) as last counted
+        self._users = {}
+        self._lock = threading.Lock()
+        self._published_at = None
+
+    def __len__(self):
+        return len(self._users)
+
+    def __contains__(self, user_id):
+        return user_id in self._users
+
+    def observe(self, user_id, goal, intake, bmi_cat):
+        """Count ``user_id`` with this goal, intake and BMI category from now on.
+
+        Cheap when nothing changed, so it can be called on every rerun.
+        """
+        entry = (goal, intake, bmi_cat)
+        with self._lock:
+            old = self._users.get(user_id)
+            if old == entry:
+                return
+            if old is not None:
+                self._count(old, -1)
+            self._users[user_id] = entry
+            self._count(entry, 1)
+
+    def forget(self, user_id):
+        """Stop counting ``user_id``, e.g. when their session is evicted."""
+        with self._lock:
+            old = self._users.pop(user_id, None)
+            if old is not None:
+                self._count(old, -1)
+
+    def _count(self, entry, sign):
+        goal, intake, bmi_cat = entry
+        totals = self._totals
+        totals.users += sign
+        totals.goal_sum += sign * goal
+        totals.intake_sum += sign * intake
+        percent = progress_percent(intake, goal)
+        totals.progress[self.rules.progress.index(percent)] += sign
+        if bmi_cat is not None:
+            totals.bmi[bmi_cat] = totals.bmi.get(bmi_cat, 0) + sign
+        sketches = totals.sketches
+        sketches["goal"].add(goal, sign)
+        sketches["intake"].add(intake, sign)
+        sketches["progress"].add(percent, sign)
+
+    def snapshot(self):
+        with self._lock:
+            snapshot = self._totals.copy()
+        snapshot.taken_at = self.clock()
+        return snapshot
+
+    def publish(self, directory, interval=PUBLISH_INTERVAL):
+        """Write this process's snapshot into ``directory`` at most every ``interval`` seconds.
+
+        Returns the file written, or ``None`` if it was too soon.
+        """
+        now = self.clock()
+        if self._published_at is not None and now - self._published_at < interval:
+            return None
+        self._published_at = now
+        path = snapshot_path(directory)
+        write_snapshot(self.snapshot(), path)
+        return path
+
+
+def snapshot_path(directory):
+    """The file this process publishes its snapshot to."""
+    return Path(directory) / f"{socket.gethostname()}-{os.getpid()}.json"
+
+
+def write_snapshot(snapshot, path):
+    """Replace ``path`` with ``snapshot`` atomically, so readers never see half a file."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(snapshot.to_dict(), f, separators=(",", ":"))
+    os.replace(tmp, path)
+
+
+def read_snapshot(path):
+    with open(path, encoding="utf-8") as f:
+        return Snapshot.from_dict(json.load(f))
+
+
+def merge_snapshot_files(directory, into=None, max_age=MAX_SNAPSHOT_AGE, exclude=(), now=None):
+    """Merge the snapshots in ``directory`` taken in the last ``max_age`` seconds.
+
+    Older files are left by processes that have stopped and are skipped, as
+    are unreadable ones and any path in ``exclude``.  The result is merged
+    into ``into`` if given, else into an empty snapshot.
+    """
+    now = time.time() if now is None else now
+    exclude = {Path(p) for p in exclude}
+    merged = into
+    for path in sorted(Path(directory).glob("*.json")):
+        if path in exclude:
+            continue
+        try:
+            snapshot = read_snapshot(path)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning("skipping analytics snapshot %s: %s", path, e)
+            continue
+        if now - snapshot.taken_at > max_age:
+            continue
+        merged = snapshot if merged is None else merged.merge(snapshot)
+    if merged is None:
+        merged = Snapshot.empty()
+        merged.processes = 0
+    return merged
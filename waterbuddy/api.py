@@ -0,0 +1,418 @@
+"""Asyncio HTTP/1.1 JSON API for goal calculation and intake tracking.
+
+Standard library only.  Connections are kept alive until the client closes
+them or sends ``Connection: close``.  Endpoints:
+
+    POST /v1/goal                  profile or list of profiles -> goal breakdown(s)
+    GET  /v1/users/<uid>           saved profile, today's progress and history summary
+    PUT  /v1/users/<uid>/profile   save a profile and its goal
+    POST /v1/users/<uid>/intake    {"ml": 250} or a list of those
+    POST /v1/users/<uid>/undo      remove the last drink of the day
+    POST /v1/users/<uid>/reset     start a new day
+    POST /v1/reminders/drain       {"limit": 1000} -> reminders that are due now (admin)
+    GET  /v1/analytics             population snapshot for this process (admin)
+    GET  /metrics                  Prometheus text, when WATERBUDDY_METRICS=1
+
+A profile is ``{"age": .., "height": .., "weight": .., "condition": ..}``
+with whole numbers, as in the app's form (and the database's integer
+columns), so goals are answered from the precomputed goal index
+(``waterbuddy.goal_index``).  The other ``/v1/users/<uid>`` endpoints answer
+404 until the user's profile has been saved.  The admin endpoints need
+``Authorization: Bearer <WATERBUDDY_ADMIN_TOKEN>`` and answer 404 while that
+variable is unset, like the app's ``?admin=`` dashboard.
+Users are held in a ``SessionRegistry``, as in the app: each is loaded once
+and kept until idle or crowded out, and actions run on a worker thread so
+loads and writes never block the event loop.  With a ``Store`` (``--db``)
+writes are queued and the file is this server's alone; ``Store`` refuses a
+file that another process, such as the app, is already writing.  To serve
+the app's users, point ``--shards`` at the app's ``WATERBUDDY_SHARDS`` files:
+``ShardedStore`` versions every user, so a user changed by the app is
+reloaded here and the other way round.
+
+Progress responses carry the user's ``next_reminder`` time from a
+``ReminderScheduler`` covering every user this process holds; a notifier
+polls the drain endpoint to send them.  The same users are counted in a
+``PopulationStats``, whose snapshot can be merged with other processes'
+(``--analytics-dir`` publishes it to a shared directory, the way the
+Streamlit app does).  Both forget a user when the registry drops them.
+
+    python -m waterbuddy.api --port 8080
+"""
+
+import argparse
+import asyncio
+import hmac
+import json
+import logging
+import os
+import signal
+import sys
+import time
+from http import HTTPStatus
+
+from waterbuddy.analytics import PUBLISH_INTERVAL, PopulationStats
+from waterbuddy.core import progress_percent
+from waterbuddy.goal_index import get_goal_index
+from waterbuddy.history import day_ordinal, roll_over
+from waterbuddy.intake import MAX_DRINK_ML
+from waterbuddy.metrics import get_metrics
+from waterbuddy.reminders import ReminderScheduler
+from waterbuddy.rules import get_rules
+from waterbuddy.session import SessionRegistry
+from waterbuddy.sharding import DB_ENV_VAR, SHARDS_ENV_VAR, open_store
+from waterbuddy.storage import StoreInUse, VersionConflict
+
+logger = logging.getLogger(__name__)
+
+MAX_HEADER_BYTES = 16 * 1024
+MAX_BODY_BYTES = 1024 * 1024
+MAX_DRAIN = 10_000
+
+PROFILE_LIMITS = {"age": (1, 120), "height": (1, 300), "weight": (1, 500)}
+
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class PlainText(str):
+    """A handler result sent as-is with the Prometheus content type, not as JSON."""
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message=None):
+        super().__init__(message or status.phrase)
+        self.status = status
+
+
+def _parse_profile(data):
+    if not isinstance(data, dict):
+        raise HTTPError(HTTPStatus.BAD_REQUEST, "profile must be an object")
+    profile = {}
+    for field, (low, high) in PROFILE_LIMITS.items():
+        value = data.get(field)
+        if isinstance(value, bool) or not isinstance(value, int) or not low <= value <= high:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, f"{field} must be an integer between {low} and {high}")
+        profile[field] = value
+    condition = data.get("condition", get_rules().conditions[0])
+    if condition not in get_rules().conditions:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, f"unknown condition {condition!r}")
+    profile["condition"] = condition
+    return profile
+
+
+def _parse_amounts(data):
+    items = data if isinstance(data, list) else [data]
+    amounts = []
+    for item in items:
+        ml = item.get("ml") if isinstance(item, dict) else None
+        if isinstance(ml, bool) or not isinstance(ml, int) or not 0 < ml <= MAX_DRINK_ML:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, f"ml must be an integer between 1 and {MAX_DRINK_ML}")
+        amounts.append(ml)
+    return amounts
+
+
+def _unchanged(rec):
+    return None
+
+
+class HydrationAPI:
+    def __init__(self, store, reminders=None, analytics=None, metrics=None, goals=None, sessions=None,
+                 admin_token=None):
+        self.store = store
+        self.admin_token = admin_token if admin_token is not None else os.environ.get("WATERBUDDY_ADMIN_TOKEN")
+        self.goals = goals if goals is not None else get_goal_index()
+        self.reminders = reminders if reminders is not None else ReminderScheduler()
+        self.analytics = analytics if analytics is not None else PopulationStats()
+        self.metrics = metrics if metrics is not None else get_metrics()
+        self.sessions = sessions if sessions is not None else SessionRegistry(store, on_evict=self._forget)
+        self.metrics.gauge_callback("waterbuddy_active_sessions", self.sessions.__len__)
+        self.metrics.gauge_callback("waterbuddy_scheduled_reminders", self.reminders.__len__)
+        self.metrics.gauge_callback("waterbuddy_write_queue", lambda: self.store.pending)
+        self.metrics.gauge_callback("waterbuddy_dropped_writes", lambda: self.store.dropped)
+
+    def _forget(self, user_id):
+        self.analytics.forget(user_id)
+        self.reminders.cancel(user_id)
+
+    async def _update(self, user_id, action, *args, create=False):
+        """``SessionRegistry.update`` off the event loop, after rolling the
+        user's day over; returns ``(record, action's result)``.
+
+        A user without a profile gets a 404 unless ``create`` is set, and is
+        not kept in the registry, so unknown ids cannot fill it.
+        """
+        def run(rec):
+            if rec.age is None and not create:
+                return rec, None
+            self._roll_over(rec)
+            return rec, action(rec, *args)
+
+        try:
+            rec, result = await asyncio.to_thread(self.sessions.update, user_id, run)
+        except VersionConflict:
+            raise HTTPError(HTTPStatus.CONFLICT, f"user {user_id!r} kept changing elsewhere; try again") from None
+        if rec.age is None:
+            self.sessions.invalidate(user_id, rec)
+            raise HTTPError(HTTPStatus.NOT_FOUND, f"no profile for user {user_id!r}")
+        return rec, result
+
+    def _roll_over(self, rec):
+        archived = roll_over(rec.intake_log, rec.history, rec.goal, day_ordinal(time.time()))
+        if archived is not None:
+            rec.version = self.store.archive_day(rec.user_id, *archived, rec.goal, expected_version=rec.version)
+            rec.version = self.store.set_current_day(rec.user_id, rec.intake_log.day, expected_version=rec.version)
+
+    def _progress(self, rec):
+        goal, intake = rec.goal, rec.intake_log.total
+        self.analytics.observe(rec.user_id, goal, intake, rec.bmi_cat)
+        return {
+            "user_id": rec.user_id,
+            "goal": goal,
+            "intake": intake,
+            "percent": progress_percent(intake, goal),
+            "remaining": max(goal - intake, 0),
+            "day": rec.intake_log.day,
+            "next_reminder": self.reminders.update(rec.user_id, goal, intake),
+        }
+
+    # --- Actions, run by SessionRegistry.update on the user's record ---
+
+    def _save_profile(self, rec, profile, goal):
+        rec.set_profile(profile["age"], profile["height"], profile["weight"], profile["condition"])
+        rec.goal = goal
+        rec.version = self.store.save_profile(rec.user_id, goal=goal, expected_version=rec.version, **profile)
+
+    def _record_intake(self, rec, amounts):
+        # One versioned write for the whole body: if it loses a race, none of
+        # it is stored and the retry adds every drink exactly once.
+        log = rec.intake_log
+        ts = time.time()
+        for ml in amounts:
+            log.append(ml, ts)
+        rec.version = self.store.record_intakes(rec.user_id, log.day, ts, amounts, expected_version=rec.version)
+
+    def _undo(self, rec):
+        log = rec.intake_log
+        ml = log.undo_last()
+        if ml:
+            rec.version = self.store.undo_intake(rec.user_id, log.day, expected_version=rec.version)
+        return ml
+
+    def _new_day(self, rec):
+        rec.intake_log.start_new_day()
+        rec.version = self.store.set_current_day(rec.user_id, rec.intake_log.day, expected_version=rec.version)
+
+    # --- Handlers ---
+
+    async def goal(self, body):
+        if isinstance(body, list):
+            return [self.goals.breakdown(**_parse_profile(item)) for item in body]
+        return self.goals.breakdown(**_parse_profile(body))
+
+    async def get_user(self, user_id):
+        rec, _ = await self._update(user_id, _unchanged)
+        result = {"age": rec.age, "height": rec.height, "weight": rec.weight, "condition": rec.condition}
+        result.update(self._progress(rec))
+        result["history"] = rec.history.summary(result["intake"], result["goal"])
+        return result
+
+    async def put_profile(self, user_id, body):
+        profile = _parse_profile(body)
+        breakdown = self.goals.breakdown(**profile)
+        rec, _ = await self._update(user_id, self._save_profile, profile, breakdown["goal"], create=True)
+        self.analytics.observe(user_id, breakdown["goal"], rec.intake_log.total, breakdown["bmi_category"])
+        return dict(breakdown, user_id=user_id)
+
+    async def intake(self, user_id, body):
+        amounts = _parse_amounts(body)
+        rec, _ = await self._update(user_id, self._record_intake, amounts)
+        self.metrics.inc("waterbuddy_intake_actions_total", len(amounts), action="add")
+        self.metrics.inc("waterbuddy_intake_ml_total", sum(amounts))
+        return self._progress(rec)
+
+    async def undo(self, user_id, body):
+        rec, ml = await self._update(user_id, self._undo)
+        if ml:
+            self.metrics.inc("waterbuddy_intake_actions_total", action="undo")
+        return dict(self._progress(rec), undone=ml)
+
+    async def reset(self, user_id, body):
+        rec, _ = await self._update(user_id, self._new_day)
+        self.metrics.inc("waterbuddy_intake_actions_total", action="new_day")
+        return self._progress(rec)
+
+    async def drain_reminders(self, body):
+        limit = body.get("limit", 1000) if isinstance(body, dict) else None
+        if isinstance(limit, bool) or not isinstance(limit, int) or not 1 <= limit <= MAX_DRAIN:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, f"limit must be an integer between 1 and {MAX_DRAIN}")
+        return {"reminders": [r._asdict() for r in self.reminders.drain(limit)]}
+
+    def _require_admin(self, headers):
+        if not self.admin_token:
+            raise HTTPError(HTTPStatus.NOT_FOUND, "admin endpoints are off; set WATERBUDDY_ADMIN_TOKEN")
+        scheme, _, value = (headers or {}).get("authorization", "").partition(" ")
+        if scheme.lower() != "bearer" or not hmac.compare_digest(value.strip().encode(), self.admin_token.encode()):
+            raise HTTPError(HTTPStatus.UNAUTHORIZED, "admin token required")
+
+    async def dispatch(self, method, path, body, headers=None):
+        parts = [p for p in path.split("?", 1)[0].split("/") if p]
+        if parts == ["metrics"]:
+            if method != "GET":
+                raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED)
+            if not self.metrics.enabled:
+                raise HTTPError(HTTPStatus.NOT_FOUND, "metrics are off; set WATERBUDDY_METRICS=1")
+            return PlainText(self.metrics.render())
+        if parts[:1] != ["v1"]:
+            raise HTTPError(HTTPStatus.NOT_FOUND)
+        parts = parts[1:]
+        if parts == ["goal"]:
+            if method != "POST":
+                raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED)
+            return await self.goal(body)
+        if parts == ["analytics"]:
+            if method != "GET":
+                raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED)
+            self._require_admin(headers)
+            return self.analytics.snapshot().to_dict()
+        if parts == ["reminders", "drain"]:
+            if method != "POST":
+                raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED)
+            self._require_admin(headers)
+            return await self.drain_reminders(body)
+        if len(parts) == 2 and parts[0] == "users":
+            if method != "GET":
+                raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED)
+            return await self.get_user(parts[1])
+        if len(parts) == 3 and parts[0] == "users":
+            user_id, action = parts[1], parts[2]
+            if action == "profile" and method in ("PUT", "POST"):
+                return await self.put_profile(user_id, body)
+            handler = {"intake": self.intake, "undo": self.undo, "reset": self.reset}.get(action)
+            if handler is None:
+                raise HTTPError(HTTPStatus.NOT_FOUND)
+            if method != "POST":
+                raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED)
+            return await handler(user_id, body)
+        raise HTTPError(HTTPStatus.NOT_FOUND)
+
+    # --- HTTP plumbing ---
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except asyncio.IncompleteReadError:
+                    break
+                except asyncio.LimitOverrunError:
+                    await self._respond(writer, HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE, {"error": "headers too large"}, False)
+                    break
+                keep_alive = await self._handle_request(head, reader, writer)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _handle_request(self, head, reader, writer):
+        try:
+            request_line, *header_lines = head.decode("latin-1").split("\r\n")
+            method, path, version = request_line.split(" ", 2)
+        except ValueError:
+            await self._respond(writer, HTTPStatus.BAD_REQUEST, {"error": "malformed request line"}, False)
+            return False
+        headers = {}
+        for line in header_lines:
+            if line:
+                name, _, value = line.partition(":")
+                headers[name.strip().lower()] = value.strip()
+        connection = headers.get("connection", "").lower()
+        keep_alive = connection != "close" if version == "HTTP/1.1" else connection == "keep-alive"
+
+        try:
+            length = int(headers.get("content-length", 0))
+        except ValueError:
+            length = -1
+        if length < 0 or length > MAX_BODY_BYTES:
+            await self._respond(writer, HTTPStatus.REQUEST_ENTITY_TOO_LARGE if length > 0 else HTTPStatus.BAD_REQUEST,
+                                {"error": "bad Content-Length"}, False)
+            return False
+        raw = await reader.readexactly(length) if length else b""
+
+        start = time.perf_counter()
+        try:
+            body = json.loads(raw) if raw else {}
+            result = await self.dispatch(method, path, body, headers)
+            status = HTTPStatus.OK
+        except json.JSONDecodeError:
+            status, result = HTTPStatus.BAD_REQUEST, {"error": "body is not valid JSON"}
+        except HTTPError as e:
+            status, result = e.status, {"error": str(e)}
+        except Exception:
+            logger.exception("error handling %s %s", method, path)
+            status, result = HTTPStatus.INTERNAL_SERVER_ERROR, {"error": "internal error"}
+        self.metrics.observe("waterbuddy_api_request_seconds", time.perf_counter() - start, status=status.value)
+        await self._respond(writer, status, result, keep_alive)
+        return keep_alive
+
+    async def _respond(self, writer, status, payload, keep_alive):
+        if isinstance(payload, PlainText):
+            body, content_type = payload.encode(), PROMETHEUS_CONTENT_TYPE
+        else:
+            body, content_type = json.dumps(payload, separators=(",", ":")).encode(), "application/json"
+        writer.write(
+            f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+
+
+async def _publish_analytics(analytics, directory):
+    while True:
+        await asyncio.to_thread(analytics.publish, directory, 0)
+        await asyncio.sleep(PUBLISH_INTERVAL)
+
+
+async def serve(host, port, store, ready=None, analytics_dir=None):
+    api = HydrationAPI(store)
+    publisher = asyncio.ensure_future(_publish_analytics(api.analytics, analytics_dir)) if analytics_dir else None
+    server = await asyncio.start_server(api.handle_connection, host, port, limit=MAX_HEADER_BYTES, backlog=1024)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    if ready is not None:
+        ready(server)
+    try:
+        async with server:
+            await stop.wait()
+    finally:
+        if publisher is not None:
+            publisher.cancel()
+        # Commit whatever is still in the write-behind queue before exiting.
+        await asyncio.to_thread(store.close)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="WaterBuddy HTTP API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--db", default=os.environ.get(DB_ENV_VAR, "waterbuddy.db"),
+                        help="SQLite file for this server alone; one the app has open is refused")
+    parser.add_argument("--shards", default=os.environ.get(SHARDS_ENV_VAR, ""),
+                        help="comma-separated shard files to share with the app (as in WATERBUDDY_SHARDS)")
+    parser.add_argument("--analytics-dir", default=os.environ.get("WATERBUDDY_ANALYTICS_DIR"),
+                        help="directory to publish population snapshots to")
+    args = parser.parse_args(argv)
+    try:
+        store = open_store({SHARDS_ENV_VAR: args.shards, DB_ENV_VAR: args.db})
+    except StoreInUse as e:
+        sys.exit(f"error: {e}")
+    asyncio.run(serve(args.host, args.port, store, analytics_dir=args.analytics_dir))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""Vectorized goal engine for whole rosters.
+
+Every function here mirrors one of the scalar helpers in ``waterbuddy.core`` and
+returns exactly what that helper would return element by element, using
+the same compiled rule tables (``rules`` defaults to ``get_rules()``).  The
+``main`` entry point streams a CSV through the engine chunk by chunk::
+
+    python -m waterbuddy.batch roster.csv -o goals.csv
+"""
+
+import argparse
+import sys
+
+from functools import lru_cache
+
+import numpy as np
+
+from waterbuddy.rules import get_rules
+
+DEFAULT_CHUNK_SIZE = 200_000
+INPUT_COLUMNS = ("age", "height", "weight", "condition")
+OUTPUT_COLUMNS = ("bmi", "bmi_category", "goal")
+BREAKDOWN_COLUMNS = ("base_goal", "bmi_adjustment", "condition_adjustment")
+NUMERIC_COLUMNS = ("age", "height", "weight")
+
+
+class RosterError(ValueError):
+    pass
+
+
+def _round_1(values):
+    # np.round scales by 10 and rounds half to even, while round() rounds the
+    # exact binary value.  They only disagree right next to a .x5 tie, so
+    # those few elements are redone with round() itself.
+    rounded = np.round(values, 1)
+    scaled = values * 10
+    near_tie = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    if near_tie.any():
+        idx = np.flatnonzero(near_tie)
+        rounded[idx] = [round(v, 1) for v in values[idx].tolist()]
+    return rounded
+
+
+def calculate_bmi(weight, height_cm):
+    weight = np.asarray(weight, dtype=np.float64)
+    height_m = np.asarray(height_cm, dtype=np.float64) / 100
+    with np.errstate(divide="ignore", invalid="ignore"):
+        bmi = _round_1(weight / (height_m ** 2))
+    return np.where(height_m == 0, 0.0, bmi)
+
+
+class _RuleArrays:
+    # NumPy views of a RuleSet, built once per rule set.
+    def __init__(self, rules):
+        bmi = rules.bmi_category
+        self.bmi_bounds = np.asarray(bmi.bounds, dtype=np.float64)
+        self.bmi_side = "right" if bmi.closed == "left" else "left"
+        self.bmi_labels = np.asarray(rules.bmi_categories, dtype=object)
+        self.bmi_colors = np.asarray([color for _, color in bmi.values], dtype=object)
+        self.bmi_adjustments = np.asarray(
+            [rules.bmi_adjustment.lookup(label) for label in rules.bmi_categories], dtype=np.int64
+        )
+        age = rules.base_goal
+        self.age_bounds = np.asarray(age.bounds, dtype=np.float64)
+        self.age_side = "right" if age.closed == "left" else "left"
+        self.age_goals = np.asarray(age.values, dtype=np.int64)
+        self.condition_adjustment = rules.condition_adjustment
+
+
+@lru_cache(maxsize=8)
+def _arrays(rules):
+    return _RuleArrays(rules)
+
+
+def bmi_category_codes(bmi, rules=None):
+    """Index into the BMI category table for each BMI (NaN lands on the last one)."""
+    arrays = _arrays(rules or get_rules())
+    return np.searchsorted(arrays.bmi_bounds, np.asarray(bmi, dtype=np.float64), side=arrays.bmi_side)
+
+
+def bmi_category(bmi, rules=None):
+    arrays = _arrays(rules or get_rules())
+    codes = bmi_category_codes(bmi, rules)
+    return arrays.bmi_labels[codes], arrays.bmi_colors[codes]
+
+
+def base_goal_by_age(age, rules=None):
+    arrays = _arrays(rules or get_rules())
+    return arrays.age_goals[np.searchsorted(arrays.age_bounds, np.asarray(age, dtype=np.float64), side=arrays.age_side)]
+
+
+def bmi_adjustment(codes, rules=None):
+    return _arrays(rules or get_rules()).bmi_adjustments[np.asarray(codes)]
+
+
+def health_condition_adjustment(conditions, rules=None):
+    table = _arrays(rules or get_rules()).condition_adjustment
+    conditions = np.asarray(conditions, dtype=object)
+    out = np.full(conditions.shape, table.default, dtype=np.int64)
+    for name, value in table.values.items():
+        if value != table.default:
+            out[conditions == name] = value
+    return out
+
+
+def compute_goals(age, height, weight, condition, rules=None):
+    """Return BMI, category and goal columns for parallel input arrays."""
+    rules = rules or get_rules()
+    bmi = calculate_bmi(weight, height)
+    codes = bmi_category_codes(bmi, rules)
+    base = base_goal_by_age(age, rules)
+    bmi_adj = bmi_adjustment(codes, rules)
+    cond_adj = health_condition_adjustment(condition, rules)
+    return {
+        "bmi": bmi,
+        "bmi_category": _arrays(rules).bmi_labels[codes],
+        "base_goal": base,
+        "bmi_adjustment": bmi_adj,
+        "condition_adjustment": cond_adj,
+        "goal": base + bmi_adj + cond_adj,
+    }
+
+
+def iter_goal_chunks(source, chunk_size=DEFAULT_CHUNK_SIZE, breakdown=False):
+    """Yield one DataFrame of the roster's rows plus goal columns per chunk of ``source``.
+
+    Every column of the roster, including ones the goal does not use (an
+    employee or patient id, say), is passed through as the original text, so
+    the output joins back on whatever key the roster has and writing it
+    costs no float formatting.  A missing input column, a column that
+    would be overwritten by a goal column, or an age, height or weight that
+    is blank or not a number raises ``RosterError``; a bad value is reported
+    by its data row (1 is the first record after the header, blank lines
+    are not counted), since quoted fields can span several lines of the file.
+    """
+    import pandas as pd
+
+    columns = OUTPUT_COLUMNS + BREAKDOWN_COLUMNS if breakdown else OUTPUT_COLUMNS
+    reader = pd.read_csv(source, chunksize=chunk_size, dtype=str, keep_default_na=False)
+    for chunk in reader:
+        missing = [name for name in INPUT_COLUMNS if name not in chunk.columns]
+        if missing:
+            raise RosterError(f"missing columns {missing}; expected {list(INPUT_COLUMNS)}")
+        clash = [name for name in columns if name in chunk.columns]
+        if clash:
+            raise RosterError(f"roster already has output columns {clash}; rename or drop them first")
+        numbers = {}
+        for name in NUMERIC_COLUMNS:
+            values = pd.to_numeric(chunk[name].str.strip(), errors="coerce").to_numpy(dtype=np.float64)
+            bad = np.flatnonzero(np.isnan(values))
+            if bad.size:
+                row = bad[0]
+                # the chunk's index counts data rows from 0 across chunks
+                raise RosterError(f"bad {name} {chunk[name].iloc[row]!r} in data row {chunk.index[row] + 1}")
+            numbers[name] = values
+        results = compute_goals(numbers["age"], numbers["height"], numbers["weight"], chunk["condition"].to_numpy())
+        yield chunk.assign(**{name: results[name] for name in columns})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compute hydration goals for a CSV roster.")
+    parser.add_argument("input", help="CSV with age, height, weight and condition columns ('-' for stdin)")
+    parser.add_argument("-o", "--output", default="-", help="output CSV path (default: stdout)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="rows per chunk")
+    parser.add_argument("--breakdown", action="store_true", help="also write base goal and adjustment columns")
+    args = parser.parse_args(argv)
+
+    source = sys.stdin if args.input == "-" else args.input
+    out = sys.stdout if args.output == "-" else open(args.output, "w", newline="")
+    try:
+        for i, chunk in enumerate(iter_goal_chunks(source, args.chunk_size, args.breakdown)):
+            chunk.to_csv(out, header=(i == 0), index=False)
+    except RosterError as e:
+        sys.exit(f"error: {e}")
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Custom Streamlit components used by the app.
+
+``intake_buttons`` draws the stats row, the water glass and the quick-add
+buttons in the browser.  A tap moves the fill at once; taps that land within
+``debounce_ms`` of each other go to the server as one batch::
+
+    {"seq": 7, "amounts": [250, 250, 500]}
+
+Each tap is numbered, ``seq`` is the number of the last one and ``amounts``
+are every tap the server has not acknowledged yet, oldest first.  The page
+passes the last applied number back as ``applied_seq`` and the component
+keeps resending unacknowledged taps with later batches, so a batch that is
+delivered twice, or not at all, never changes the total by the wrong amount.
+"""
+
+from pathlib import Path
+
+import streamlit.components.v1 as components
+
+_intake_buttons = components.declare_component(
+    "intake_buttons", path=str(Path(__file__).resolve().parent / "intake_buttons")
+)
+
+
+def intake_buttons(intake, goal, progress, buttons, applied_seq, remind_in=None, debounce_ms=400, key=None,
+                   on_change=None):
+    """Render the intake controls; returns the latest batch or ``None``.
+
+    ``progress`` is the ``ThresholdTable`` of progress emojis, so the glass
+    can pick the right one for totals the server has not seen yet, and
+    ``buttons`` is a sequence of ``(ml, caption)`` pairs.  ``remind_in`` is
+    the number of seconds until the user's next reminder (``None`` if there
+    is none); the prompt shows that time and turns into the reminder when
+    it passes.
+    """
+    return _intake_buttons(
+        intake=intake,
+        goal=goal,
+        bounds=list(progress.bounds),
+        stages=[list(v) for v in progress.values],
+        buttons=[list(b) for b in buttons],
+        applied_seq=applied_seq,
+        remind_in=remind_in,
+        debounce_ms=debounce_ms,
+        key=key,
+        on_change=on_change,
+        default=None,
+    )
+
+
+def unapplied_taps(batch, applied_seq, allowed):
+    """Amounts in ``batch`` numbered after ``applied_seq``, and the new last number.
+
+    Anything that is not a well-formed batch, or that carries an amount not
+    in ``allowed``, is ignored as a whole.
+    """
+    if not isinstance(batch, dict):
+        return [], applied_seq
+    seq, amounts = batch.get("seq"), batch.get("amounts")
+    if type(seq) is not int or not isinstance(amounts, list) or len(amounts) > seq:
+        return [], applied_seq
+    if any(type(ml) is not int or ml not in allowed for ml in amounts):
+        return [], applied_seq
+    fresh = seq - applied_seq
+    if fresh <= 0:
+        return [], applied_seq
+    return amounts[-fresh:], seq
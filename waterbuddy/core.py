@@ -0,0 +1,55 @@
+"""Goal, BMI and progress logic shared by the UI, the batch engine and tools.
+
+Nothing here imports Streamlit; importing this module only loads the rule
+tables.
+"""
+
+from waterbuddy.rules import get_rules
+
+
+def calculate_bmi(weight, height_cm):
+    height_m = height_cm / 100
+    if height_m == 0:
+        return 0
+    return round(weight / (height_m ** 2), 1)
+
+
+def bmi_category(bmi):
+    return get_rules().bmi_category.lookup(bmi)
+
+
+def base_goal_by_age(age):
+    return get_rules().base_goal.lookup(age)
+
+
+def health_condition_adjustment(condition):
+    return get_rules().condition_adjustment.lookup(condition)
+
+
+def bmi_adjustment(category):
+    return get_rules().bmi_adjustment.lookup(category)
+
+
+def emoji_for_progress(percentage):
+    return get_rules().progress.lookup(percentage)
+
+
+def goal_breakdown(age, height, weight, condition):
+    """Everything the summary page shows for a profile, as a dict."""
+    bmi = calculate_bmi(weight, height)
+    category, _ = bmi_category(bmi)
+    base = base_goal_by_age(age)
+    bmi_adj = bmi_adjustment(category)
+    cond_adj = health_condition_adjustment(condition)
+    return {
+        "bmi": bmi,
+        "bmi_category": category,
+        "base_goal": base,
+        "bmi_adjustment": bmi_adj,
+        "condition_adjustment": cond_adj,
+        "goal": base + bmi_adj + cond_adj,
+    }
+
+
+def progress_percent(intake, goal):
+    return int(min((intake / goal) * 100, 100)) if goal > 0 else 0
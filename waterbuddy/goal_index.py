@@ -0,0 +1,303 @@
+"""Precomputed goals for every profile the input form can produce.
+
+The form only takes whole numbers: age 1-120, height 1-300 cm and weight
+1-500 kg, plus one of the rule set's conditions.  A goal is
+``base(age) + bmi_adjustment(category(height, weight)) + condition(c)``, so
+instead of 72 million goals the index stores the factors:
+
+- BMI x 10 and the BMI category for each (height, weight) cell
+- the base goal for each age
+- the condition adjustments (few enough to live in the header)
+
+which is about 750 KB.  ``build`` writes it once; ``GoalIndex`` maps the
+file read-only, so every process using it shares the same pages, and
+answers a lookup with index arithmetic and three array reads.  Inputs
+outside the domain (floats, out-of-range values) fall through
+to ``waterbuddy.core``, so ``GoalIndex.breakdown`` returns exactly what
+``goal_breakdown`` would for any input.
+
+Layout (native byte order, recorded in the header)::
+
+    b"WBGI"  u32 header length  header JSON, padded with spaces to 8 bytes
+    bmi10     u32[MAX_HEIGHT * MAX_WEIGHT]   row per height, then weight
+    category  u8 [MAX_HEIGHT * MAX_WEIGHT]   index into the BMI categories
+    base      i32[MAX_AGE + 1]               by age; 0 is unused
+
+The header names the digest of the rule tables the index was built from;
+an index built from other rules is refused and ``get_goal_index`` rebuilds
+it.
+
+    python -m waterbuddy.goal_index build goals.idx
+    python -m waterbuddy.goal_index verify goals.idx
+"""
+
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import random
+import stat
+import struct
+import sys
+import tempfile
+from array import array
+from functools import lru_cache
+from pathlib import Path
+
+from waterbuddy.core import calculate_bmi, goal_breakdown
+from waterbuddy.rules import get_rules
+
+GOAL_INDEX_ENV_VAR = "WATERBUDDY_GOAL_INDEX"
+MAGIC = b"WBGI"
+FORMAT_VERSION = 1
+MAX_AGE = 120
+MAX_HEIGHT = 300
+MAX_WEIGHT = 500
+
+_LENGTH = struct.Struct("<I")
+
+
+class GoalIndexError(ValueError):
+    pass
+
+
+def rules_digest(rules):
+    """Fingerprint of everything in ``rules`` that a goal depends on."""
+    tables = [FORMAT_VERSION, MAX_AGE, MAX_HEIGHT, MAX_WEIGHT]
+    for table in (rules.bmi_category, rules.base_goal):
+        tables.append([table.bounds, table.values, table.closed])
+    for table in (rules.condition_adjustment, rules.bmi_adjustment):
+        tables.append([sorted(table.values.items()), table.default])
+    return hashlib.blake2b(json.dumps(tables).encode(), digest_size=16).hexdigest()
+
+
+def _private_dir():
+    """A directory only this user can write to, for the default index.
+
+    ``$XDG_CACHE_HOME/waterbuddy`` (``~/.cache/waterbuddy``), or if that
+    cannot be created a ``waterbuddy-<uid>`` directory in the temp
+    directory.  Either is created with mode 0700 and used only if it is a
+    real directory owned by this user that nobody else can write to, so
+    another account cannot plant or lock the index.
+    """
+    uid = os.getuid() if hasattr(os, "getuid") else None
+    cache = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    candidates = (Path(cache) / "waterbuddy",
+                  Path(tempfile.gettempdir()) / ("waterbuddy" if uid is None else f"waterbuddy-{uid}"))
+    for path in candidates:
+        try:
+            path.mkdir(mode=0o700, parents=True, exist_ok=True)
+            info = path.lstat()
+        except OSError:
+            continue
+        if stat.S_ISDIR(info.st_mode) and (uid is None or info.st_uid == uid) and not info.st_mode & 0o022:
+            return path
+    raise GoalIndexError(f"no private directory for the goal index; set {GOAL_INDEX_ENV_VAR}")
+
+
+def default_path(rules=None):
+    """Where ``get_goal_index`` keeps the index for ``rules`` when
+    ``WATERBUDDY_GOAL_INDEX`` is unset: one file per rule set in
+    ``_private_dir()``, shared by every process this user runs."""
+    digest = rules_digest(rules or get_rules())
+    return _private_dir() / f"goals-{digest[:16]}.idx"
+
+
+def build(path, rules=None):
+    """Compute the index for ``rules`` and write it to ``path`` atomically."""
+    rules = rules or get_rules()
+    categories = rules.bmi_categories
+    if len(categories) > 256:
+        raise GoalIndexError(f"at most 256 BMI categories fit the index, got {len(categories)}")
+    table = rules.bmi_category
+    bmi10 = array("I")
+    codes = array("B")
+    for height in range(1, MAX_HEIGHT + 1):
+        for weight in range(1, MAX_WEIGHT + 1):
+            bmi = calculate_bmi(weight, height)
+            bmi10.append(round(bmi * 10))
+            codes.append(table.index(bmi))
+    base = array("i", (rules.base_goal.lookup(age) for age in range(MAX_AGE + 1)))
+
+    header = json.dumps({
+        "version": FORMAT_VERSION,
+        "rules": rules_digest(rules),
+        "byteorder": sys.byteorder,
+        "max_age": MAX_AGE,
+        "max_height": MAX_HEIGHT,
+        "max_weight": MAX_WEIGHT,
+        "categories": categories,
+        "bmi_adjustments": [rules.bmi_adjustment.lookup(label) for label in categories],
+        "conditions": rules.condition_adjustment.values,
+        "condition_default": rules.condition_adjustment.default,
+    }).encode()
+    header += b" " * (-(len(MAGIC) + _LENGTH.size + len(header)) % 8)
+
+    path = Path(path)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp, "wb") as f:
+        f.write(MAGIC + _LENGTH.pack(len(header)) + header)
+        f.write(bmi10.tobytes())
+        f.write(codes.tobytes())
+        f.write(base.tobytes())
+    os.replace(tmp, path)
+    return path
+
+
+class GoalIndex:
+    """Read-only, memory-mapped view of an index file."""
+
+    def __init__(self, path, rules=None):
+        self.path = Path(path)
+        with open(self.path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self._open(rules or get_rules())
+        except Exception:
+            self.close()
+            raise
+
+    def _open(self, rules):
+        buf = memoryview(self._mmap)
+        self._buf = buf
+        if len(buf) < 8 or bytes(buf[:4]) != MAGIC:
+            raise GoalIndexError(f"{self.path}: not a goal index")
+        (length,) = _LENGTH.unpack_from(buf, 4)
+        pos = 8 + length
+        header = json.loads(bytes(buf[8:pos]))
+        if header.get("version") != FORMAT_VERSION or header.get("byteorder") != sys.byteorder:
+            raise GoalIndexError(f"{self.path}: built by another version or on another platform")
+        if header.get("rules") != rules_digest(rules):
+            raise GoalIndexError(f"{self.path}: built from different rule tables")
+        cells = MAX_HEIGHT * MAX_WEIGHT
+        sizes = (cells * 4, cells, (MAX_AGE + 1) * 4)
+        if len(buf) != pos + sum(sizes):
+            raise GoalIndexError(f"{self.path}: expected {pos + sum(sizes)} bytes, found {len(buf)}")
+        self._bmi10 = buf[pos:pos + sizes[0]].cast("I")
+        pos += sizes[0]
+        self._codes = buf[pos:pos + sizes[1]]
+        pos += sizes[1]
+        self._base = buf[pos:pos + sizes[2]].cast("i")
+        self.categories = tuple(header["categories"])
+        self._bmi_adjustments = tuple(header["bmi_adjustments"])
+        self._conditions = header["conditions"]
+        self._condition_default = header["condition_default"]
+
+    def close(self):
+        for name in ("_bmi10", "_codes", "_base", "_buf"):
+            view = self.__dict__.pop(name, None)
+            if view is not None:
+                view.release()
+        self._mmap.close()
+
+    def covers(self, age, height, weight):
+        """Whether the profile is in the precomputed domain."""
+        return (type(age) is int and type(height) is int and type(weight) is int
+                and 1 <= age <= MAX_AGE and 1 <= height <= MAX_HEIGHT and 1 <= weight <= MAX_WEIGHT)
+
+    def goal(self, age, height, weight, condition):
+        if not self.covers(age, height, weight):
+            return goal_breakdown(age, height, weight, condition)["goal"]
+        return (self._base[age] + self._bmi_adjustments[self._codes[(height - 1) * MAX_WEIGHT + weight - 1]]
+                + self._conditions.get(condition, self._condition_default))
+
+    def breakdown(self, age, height, weight, condition):
+        """Same dict as ``waterbuddy.core.goal_breakdown``."""
+        if not self.covers(age, height, weight):
+            return goal_breakdown(age, height, weight, condition)
+        cell = (height - 1) * MAX_WEIGHT + weight - 1
+        code = self._codes[cell]
+        base = self._base[age]
+        bmi_adj = self._bmi_adjustments[code]
+        cond_adj = self._conditions.get(condition, self._condition_default)
+        return {
+            "bmi": self._bmi10[cell] / 10,
+            "bmi_category": self.categories[code],
+            "base_goal": base,
+            "bmi_adjustment": bmi_adj,
+            "condition_adjustment": cond_adj,
+            "goal": base + bmi_adj + cond_adj,
+        }
+
+
+def verify(index, samples=100_000, seed=0, full=False):
+    """Check ``index`` against ``waterbuddy.core``; return how many profiles were compared.
+
+    Every (height, weight) cell, every age and every condition is checked
+    on its own, which covers each stored value.  Then ``samples`` random
+    profiles (or, with ``full``, all 72 million) are compared whole with
+    ``goal_breakdown``.  Raises ``GoalIndexError`` at the first difference.
+    """
+    rules = get_rules()
+
+    def check(age, height, weight, condition):
+        got = index.breakdown(age, height, weight, condition)
+        expected = goal_breakdown(age, height, weight, condition)
+        if got != expected:
+            raise GoalIndexError(f"{(age, height, weight, condition)}: index gives {got}, expected {expected}")
+
+    conditions = rules.conditions
+    for height in range(1, MAX_HEIGHT + 1):
+        for weight in range(1, MAX_WEIGHT + 1):
+            check(1 + (height + weight) % MAX_AGE, height, weight, conditions[(height * weight) % len(conditions)])
+    for age in range(1, MAX_AGE + 1):
+        for condition in conditions + ("not a listed condition",):
+            check(age, 170, 65, condition)
+    checked = MAX_HEIGHT * MAX_WEIGHT + MAX_AGE * (len(conditions) + 1)
+    if full:
+        for age in range(1, MAX_AGE + 1):
+            for height in range(1, MAX_HEIGHT + 1):
+                for weight in range(1, MAX_WEIGHT + 1):
+                    for condition in conditions:
+                        check(age, height, weight, condition)
+        return checked + MAX_AGE * MAX_HEIGHT * MAX_WEIGHT * len(conditions)
+    rng = random.Random(seed)
+    for _ in range(samples):
+        check(rng.randint(1, MAX_AGE), rng.randint(1, MAX_HEIGHT), rng.randint(1, MAX_WEIGHT),
+              rng.choice(conditions))
+    return checked + samples
+
+
+@lru_cache(maxsize=None)
+def get_goal_index():
+    """The index for the active rules, at ``WATERBUDDY_GOAL_INDEX`` or
+    ``default_path()``; built there first if it is missing or stale."""
+    rules = get_rules()
+    path = os.environ.get(GOAL_INDEX_ENV_VAR) or default_path(rules)
+    try:
+        return GoalIndex(path, rules)
+    except (FileNotFoundError, GoalIndexError):
+        build(path, rules)
+        return GoalIndex(path, rules)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or check the precomputed goal index.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name, text in (("build", "write the index for the active rules"),
+                       ("verify", "compare an index with the scalar goal functions")):
+        cmd = sub.add_parser(name, help=text)
+        cmd.add_argument("path", nargs="?", help="index file (default: WATERBUDDY_GOAL_INDEX or one in the user's cache)")
+    sub.choices["verify"].add_argument("--samples", type=int, default=100_000, help="random whole profiles")
+    sub.choices["verify"].add_argument("--full", action="store_true", help="check every profile in the domain")
+    args = parser.parse_args(argv)
+
+    try:
+        path = args.path or os.environ.get(GOAL_INDEX_ENV_VAR) or default_path()
+    except GoalIndexError as e:
+        sys.exit(f"error: {e}")
+    if args.command == "build":
+        build(path)
+        print(f"wrote {path} ({os.path.getsize(path):,} bytes)")
+        return
+    try:
+        index = GoalIndex(path)
+        checked = verify(index, args.samples, full=args.full)
+    except (OSError, GoalIndexError) as e:
+        sys.exit(f"error: {e}")
+    print(f"{path}: {checked:,} lookups match waterbuddy.core")
+
+
+if __name__ == "__main__":
+    main()
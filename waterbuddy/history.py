@@ -0,0 +1,141 @@
+"""Archived daily totals per user, with streak and rolling averages kept up to date.
+
+When a calendar day ends, ``roll_over`` moves its total and goal out of the
+``IntakeLog`` into the user's ``DayHistory``: three parallel arrays of date,
+ml and goal, one entry per day the user drank anything.  Days without an
+entry count as 0 ml.
+
+The history keeps its summaries as running values, each adjusted in O(1)
+(amortised) when a day is archived or the calendar moves on:
+
+- ``streak``: consecutive days up to ``end`` on which the goal was met
+- rolling sums over the last 7 and 30 days, from which the averages come
+- the index of the best day
+
+So reading any of them on a rerun never scans the history.  Dates are
+proleptic Gregorian ordinals (``date.toordinal()``) in local time.
+"""
+
+import datetime
+from array import array
+
+WINDOWS = (7, 30)
+
+
+def day_ordinal(ts):
+    """Local calendar date of timestamp ``ts`` as an ordinal."""
+    return datetime.date.fromtimestamp(ts).toordinal()
+
+
+class DayHistory:
+    __slots__ = ("dates", "totals", "goals", "end", "streak", "best", "_sums", "_starts")
+
+    def __init__(self):
+        self.dates = array("l")
+        self.totals = array("l")
+        self.goals = array("l")
+        # last complete day the summaries describe; None until the first archive
+        self.end = None
+        self.streak = 0
+        self.best = None
+        self._sums = [0] * len(WINDOWS)
+        self._starts = [0] * len(WINDOWS)
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Rebuild from ``(date, total, goal)`` rows in date order."""
+        history = cls()
+        for date, total, goal in rows:
+            history.archive(date, total, goal)
+        return history
+
+    def __len__(self):
+        return len(self.dates)
+
+    def archive(self, date, total, goal):
+        """Record ``total`` ml against ``goal`` for ``date``, a day after every archived one."""
+        if self.dates and date <= self.dates[-1]:
+            # Only possible if the clock or time zone went backwards; keep the
+            # arrays strictly increasing rather than merging into the last day.
+            date = self.dates[-1] + 1
+        self.advance_to(date - 1)
+        self.dates.append(date)
+        self.totals.append(total)
+        self.goals.append(goal)
+        self.end = date
+        self.streak = self.streak + 1 if goal > 0 and total >= goal else 0
+        for i in range(len(WINDOWS)):
+            self._sums[i] += total
+        self._trim()
+        if self.best is None or total > self.totals[self.best]:
+            self.best = len(self.totals) - 1
+
+    def advance_to(self, date):
+        """Move ``end`` forward to ``date``; the days skipped had no intake."""
+        if self.end is None or date <= self.end:
+            return
+        # A skipped day missed its goal, which ends the streak.
+        self.streak = 0
+        self.end = date
+        self._trim()
+
+    def _trim(self):
+        dates, totals, sums, starts = self.dates, self.totals, self._sums, self._starts
+        for i, window in enumerate(WINDOWS):
+            cutoff = self.end - window
+            start = starts[i]
+            while start < len(dates) and dates[start] <= cutoff:
+                sums[i] -= totals[start]
+                start += 1
+            starts[i] = start
+
+    def average(self, window):
+        """Mean ml per day over the last ``window`` days up to ``end`` (one of ``WINDOWS``).
+
+        A user with less history than that is averaged over the days since
+        their first archived one.
+        """
+        if self.end is None:
+            return None
+        days = min(window, self.end - self.dates[0] + 1)
+        return self._sums[WINDOWS.index(window)] / days
+
+    @property
+    def best_day(self):
+        """``(date, total)`` of the day with the most ml, or ``None``."""
+        if self.best is None:
+            return None
+        return self.dates[self.best], self.totals[self.best]
+
+    def summary(self, today_total=0, today_goal=0):
+        """Streak, averages and best day as a dict; today counts towards the
+        streak once its goal is met, but not towards the averages."""
+        met_today = today_goal > 0 and today_total >= today_goal
+        best = self.best_day
+        return {
+            "streak": self.streak + met_today,
+            "average_7": self.average(7),
+            "average_30": self.average(30),
+            "best_date": datetime.date.fromordinal(best[0]).isoformat() if best else None,
+            "best_total": best[1] if best else None,
+            "days": len(self),
+        }
+
+
+def roll_over(log, history, goal, today):
+    """Archive ``log``'s current day if it began before ``today``.
+
+    Returns the archived ``(date, total)``, or ``None`` if the current day is
+    still today (or has nothing in it).  Either way ``history`` ends up
+    describing every day before ``today``.
+    """
+    archived = None
+    started = log.day_started
+    if started is not None:
+        date = day_ordinal(started)
+        if date < today:
+            history.archive(date, log.total, goal)
+            archived = (history.dates[-1], log.total)
+            log.start_new_day()
+    history.advance_to(today - 1)
+    return archived
@@ -0,0 +1,101 @@
+"""Append-only log of drinks with running per-day totals."""
+
+import time
+from array import array
+
+# Largest single drink accepted, in ml; anything bigger is a typo.
+MAX_DRINK_ML = 5000
+
+
+class IntakeLog:
+    """Every drink as a (timestamp, ml) pair in two parallel arrays.
+
+    A "day" is the stretch between two ``start_new_day`` calls, which is what
+    the Reset button starts.  Per-day totals are kept alongside the events and
+    updated on every append or undo, so the current total never needs a scan
+    of the history.
+    """
+
+    __slots__ = ("timestamps", "amounts", "day_starts", "day_totals")
+
+    def __init__(self):
+        self.timestamps = array("d")
+        self.amounts = array("l")
+        # day_starts[i] is the index of the first event of day i
+        self.day_starts = array("q", [0])
+        self.day_totals = array("q", [0])
+
+    @classmethod
+    def from_events(cls, events, current_day=0):
+        """Rebuild a log from ``(day, timestamp, ml)`` rows in append order."""
+        log = cls()
+        for day, ts, ml in events:
+            while log.day_count <= day:
+                log._open_day()
+            # stored before MAX_DRINK_ML existed, so not checked against it
+            log._add(ml, ts)
+        while log.day_count <= current_day:
+            log._open_day()
+        return log
+
+    def __len__(self):
+        return len(self.amounts)
+
+    @property
+    def total(self):
+        """ml logged so far on the current day."""
+        return self.day_totals[-1]
+
+    @property
+    def day_count(self):
+        return len(self.day_totals)
+
+    @property
+    def today_events(self):
+        return len(self.amounts) - self.day_starts[-1]
+
+    def append(self, ml, ts=None):
+        if not 0 < ml <= MAX_DRINK_ML:
+            raise ValueError(f"intake must be between 1 and {MAX_DRINK_ML} ml, got {ml!r}")
+        self._add(ml, ts)
+
+    def _add(self, ml, ts):
+        # amounts first: if it cannot hold ml, nothing has changed yet
+        self.amounts.append(ml)
+        self.timestamps.append(time.time() if ts is None else ts)
+        self.day_totals[-1] += ml
+
+    def undo_last(self):
+        """Drop the last drink of the current day; return its ml (0 if none)."""
+        if not self.today_events:
+            return 0
+        self.timestamps.pop()
+        ml = self.amounts.pop()
+        self.day_totals[-1] -= ml
+        return ml
+
+    @property
+    def day(self):
+        """Index of the current day."""
+        return len(self.day_totals) - 1
+
+    @property
+    def day_started(self):
+        """Timestamp of the current day's first drink, or ``None`` if there is none yet."""
+        return self.timestamps[self.day_starts[-1]] if self.today_events else None
+
+    def start_new_day(self):
+        """Close the current day; its events and total stay in the log."""
+        if self.today_events:
+            self._open_day()
+
+    def _open_day(self):
+        self.day_starts.append(len(self.amounts))
+        self.day_totals.append(0)
+
+    def day_events(self, day=-1):
+        """(timestamp, ml) pairs of one day, the current one by default."""
+        day = range(self.day_count)[day]
+        start = self.day_starts[day]
+        end = self.day_starts[day + 1] if day + 1 < self.day_count else len(self.amounts)
+        return list(zip(self.timestamps[start:end], self.amounts[start:end]))
@@ -0,0 +1,321 @@
+"""Opt-in timings and counters for the app and API, in Prometheus text format.
+
+Metrics are off unless ``WATERBUDDY_METRICS=1`` or ``WATERBUDDY_METRICS_FILE``
+is set.  While they are off, ``get_metrics()`` returns a ``NullMetrics``
+whose ``timed`` hands back the function it was given and whose other methods
+do nothing, so instrumented code runs exactly as before.
+
+When on, ``Metrics`` keeps counters, gauges and fixed-bucket histograms in
+memory.  Gauges can be callbacks read at render time, so e.g. the active
+session count costs nothing between scrapes.  The API serves ``render()`` at
+``GET /metrics``; the Streamlit app has no endpoint of its own and instead
+rewrites ``WATERBUDDY_METRICS_FILE`` at most every ``FLUSH_INTERVAL`` seconds,
+which node_exporter's textfile collector (or anything else) can pick up.
+
+``profile_rerun`` captures a cProfile or tracemalloc report of one block of
+code into ``WATERBUDDY_PROFILE_DIR``; the app runs a whole rerun under it
+when opened with ``?profile=cpu`` or ``?profile=memory`` and the admin token.
+"""
+
+import functools
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager, nullcontext
+from functools import lru_cache
+from pathlib import Path
+
+METRICS_ENV_VAR = "WATERBUDDY_METRICS"
+METRICS_FILE_ENV_VAR = "WATERBUDDY_METRICS_FILE"
+PROFILE_DIR_ENV_VAR = "WATERBUDDY_PROFILE_DIR"
+FLUSH_INTERVAL = 15.0
+PROFILE_KINDS = ("cpu", "memory")
+PROFILE_TOP = 40
+
+# seconds; a function call lands in the first bucket it is <= to
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+DESCRIPTIONS = {
+    "waterbuddy_function_seconds": "Time spent in page functions and their helpers.",
+    "waterbuddy_reruns_total": "Full script reruns by the page they rendered.",
+    "waterbuddy_elements_total": "Elements sent to browsers.",
+    "waterbuddy_intake_actions_total": "Intake changes by kind.",
+    "waterbuddy_intake_ml_total": "Millilitres logged; undone drinks are not subtracted.",
+    "waterbuddy_active_sessions": "Session records held in memory.",
+    "waterbuddy_scheduled_reminders": "Users with a pending reminder.",
+    "waterbuddy_api_request_seconds": "API request handling time by HTTP status.",
+    "waterbuddy_write_queue": "Store writes waiting to be committed.",
+    "waterbuddy_dropped_writes": "Store writes that failed on their own and were given up.",
+}
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(pairs, extra=None):
+    if extra is not None:
+        pairs = pairs + (extra,)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in pairs) + "}"
+
+
+def _number(value):
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds=DEFAULT_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics:
+    """Thread-safe counters, gauges and histograms keyed by name and labels."""
+
+    enabled = True
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, clock=time.monotonic):
+        self.buckets = buckets
+        self.clock = clock
+        # name -> {sorted label pairs -> value}
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+        self._callbacks = {}
+        self._lock = threading.Lock()
+        self._flushed_at = None
+
+    def inc(self, name, value=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        with self._lock:
+            self._gauges.setdefault(name, {})[tuple(sorted(labels.items()))] = value
+
+    def gauge_callback(self, name, func):
+        """Report ``func()`` as gauge ``name`` whenever metrics are rendered."""
+        self._callbacks[name] = func
+
+    def observe(self, name, value, **labels):
+        histogram = self._histogram(name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram.observe(value)
+
+    def _histogram(self, name, key):
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram(self.buckets)
+            return histogram
+
+    @contextmanager
+    def timer(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def timed(self, func):
+        """Decorator: record each call's duration under ``waterbuddy_function_seconds``."""
+        histogram = self._histogram("waterbuddy_function_seconds", (("function", func.__name__),))
+        lock, clock = self._lock, time.perf_counter
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = clock()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = clock() - start
+                with lock:
+                    histogram.observe(elapsed)
+
+        return wrapper
+
+    def count_elements(self, ctx):
+        """Count every element a Streamlit script run context sends from now on.
+
+        Wraps the context's enqueue function once; calling this again for the
+        same context does nothing.  ``_enqueue`` is Streamlit internals, so if
+        a Streamlit version lacks it, or sends messages without the fields
+        checked here, elements simply go uncounted.
+        """
+        enqueue = getattr(ctx, "_enqueue", None)
+        if not callable(enqueue) or getattr(enqueue, "counts_elements", False):
+            return
+
+        def counting_enqueue(msg):
+            try:
+                new_element = msg.HasField("delta") and msg.delta.HasField("new_element")
+            except (AttributeError, ValueError):
+                new_element = False
+            if new_element:
+                self.inc("waterbuddy_elements_total")
+            return enqueue(msg)
+
+        counting_enqueue.counts_elements = True
+        try:
+            ctx._enqueue = counting_enqueue
+        except (AttributeError, TypeError):
+            pass
+
+    def render(self):
+        """Everything collected so far as Prometheus text exposition format."""
+        gauges = {name: {(): func()} for name, func in self._callbacks.items()}
+        lines = []
+
+        def header(name, kind):
+            if name in DESCRIPTIONS:
+                lines.append(f"# HELP {name} {DESCRIPTIONS[name]}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                header(name, "counter")
+                lines.extend(f"{name}{_labels(key)} {_number(value)}" for key, value in series.items())
+            for name, series in sorted({**self._gauges, **gauges}.items()):
+                header(name, "gauge")
+                lines.extend(f"{name}{_labels(key)} {_number(value)}" for key, value in series.items())
+            for name, series in sorted(self._histograms.items()):
+                header(name, "histogram")
+                for key, histogram in series.items():
+                    cumulative = 0
+                    for bound, count in zip(histogram.bounds, histogram.counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_labels(key, ('le', _number(bound)))} {cumulative}")
+                    lines.append(f"{name}_bucket{_labels(key, ('le', '+Inf'))} {histogram.count}")
+                    lines.append(f"{name}_sum{_labels(key)} {_number(histogram.sum)}")
+                    lines.append(f"{name}_count{_labels(key)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """Replace ``path`` with the current metrics atomically."""
+        path = Path(path)
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.write_text(self.render(), encoding="utf-8")
+        os.replace(tmp, path)
+
+    def flush(self, path, interval=FLUSH_INTERVAL):
+        """``write(path)`` unless the last flush was under ``interval`` seconds ago."""
+        now = self.clock()
+        if self._flushed_at is not None and now - self._flushed_at < interval:
+            return False
+        self._flushed_at = now
+        self.write(path)
+        return True
+
+
+class NullMetrics:
+    """Stand-in used while metrics are off: every call is a no-op."""
+
+    enabled = False
+
+    def inc(self, name, value=1, **labels):
+        pass
+
+    def set(self, name, value, **labels):
+        pass
+
+    def gauge_callback(self, name, func):
+        pass
+
+    def observe(self, name, value, **labels):
+        pass
+
+    def timer(self, name, **labels):
+        return nullcontext()
+
+    def timed(self, func):
+        return func
+
+    def count_elements(self, ctx):
+        pass
+
+    def render(self):
+        return ""
+
+    def flush(self, path, interval=FLUSH_INTERVAL):
+        return False
+
+
+@lru_cache(maxsize=None)
+def get_metrics():
+    """The process-wide registry, or a ``NullMetrics`` if metrics are off."""
+    if os.environ.get(METRICS_ENV_VAR, "") not in ("", "0") or os.environ.get(METRICS_FILE_ENV_VAR):
+        return Metrics()
+    return NullMetrics()
+
+
+@contextmanager
+def profile_rerun(kind, directory, label="rerun"):
+    """Profile the body of the ``with`` block and write a report to ``directory``.
+
+    ``kind="cpu"`` runs cProfile on the calling thread and writes both the
+    raw ``.prof`` (for snakeviz or ``pstats``) and a text summary sorted by
+    cumulative time.  ``kind="memory"`` traces allocations with tracemalloc,
+    which sees every thread in the process, and writes the top allocation
+    sites still alive at the end of the block.  The report's path is
+    available as ``.path`` on the yielded object once the block exits.
+    """
+    if kind not in PROFILE_KINDS:
+        raise ValueError(f"profile kind must be one of {PROFILE_KINDS}, got {kind!r}")
+    # Imported here so that loading this module stays cheap.
+    import cProfile
+    import io
+    import pstats
+    import tracemalloc
+
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    report = _ProfileReport(directory / f"{label}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{kind}")
+    if kind == "cpu":
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield report
+        finally:
+            profiler.disable()
+            profiler.dump_stats(report.path.with_suffix(".prof"))
+            text = io.StringIO()
+            pstats.Stats(profiler, stream=text).sort_stats("cumulative").print_stats(PROFILE_TOP)
+            report.write(text.getvalue())
+    else:
+        started = not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start(10)
+        try:
+            yield report
+        finally:
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            if started:
+                tracemalloc.stop()
+            stats = snapshot.statistics("lineno")
+            lines = [f"traced now {current / 1024:.1f} KiB, peak {peak / 1024:.1f} KiB", ""]
+            lines.extend(str(stat) for stat in stats[:PROFILE_TOP])
+            report.write("\n".join(lines) + "\n")
+
+
+class _ProfileReport:
+    def __init__(self, stem):
+        self.path = stem.with_suffix(".txt")
+
+    def write(self, text):
+        self.path.write_text(text, encoding="utf-8")
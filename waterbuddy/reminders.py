@@ -0,0 +1,142 @@
+"""When to nudge each user to drink next, for every user in one heap.
+
+A user's next reminder spreads what is left of their goal over what is left
+of the waking day: ``remaining / sip_ml`` sips, evenly spaced until
+``day_end``, but never closer than ``min_interval`` or further apart than
+``max_interval``.  Users who have met their goal, or whose next sip would
+fall after the end of the day, get no reminder.
+
+``ReminderScheduler`` keeps one heap entry per scheduled user.  Changing a
+user's goal or intake pushes a fresh entry and leaves the old one in place;
+it is recognised as stale and skipped when it reaches the top, as are the
+entries of cancelled users (the heap is rebuilt if stale entries start to
+outnumber live ones).  So ``update`` and
+each reminder taken off by ``drain`` cost O(log n), and nothing ever scans
+all users.  Time comes from the ``clock`` callable, which tests and
+simulations replace.  One scheduler can be shared between threads.
+"""
+
+import heapq
+import math
+import threading
+import time
+from typing import NamedTuple
+
+SIP_ML = 250
+MIN_INTERVAL = 15 * 60
+MAX_INTERVAL = 2 * 60 * 60
+DAY_END_HOUR = 22
+
+
+def end_of_day(ts, hour=DAY_END_HOUR):
+    """Timestamp of ``hour``:00 local time on the day of ``ts``."""
+    t = time.localtime(ts)
+    return time.mktime((t.tm_year, t.tm_mon, t.tm_mday, hour, 0, 0, 0, 0, -1))
+
+
+def next_nudge_delay(goal, intake, seconds_left, sip_ml=SIP_ML,
+                     min_interval=MIN_INTERVAL, max_interval=MAX_INTERVAL):
+    """Seconds until the next reminder, or ``None`` if there should be none."""
+    remaining = goal - intake
+    if remaining <= 0 or seconds_left <= 0:
+        return None
+    delay = min(max(seconds_left / math.ceil(remaining / sip_ml), min_interval), max_interval)
+    return delay if delay <= seconds_left else None
+
+
+class Reminder(NamedTuple):
+    user_id: str
+    due: float
+    remaining: int
+    sip: int
+
+
+class ReminderScheduler:
+    def __init__(self, clock=time.time, day_end=end_of_day, sip_ml=SIP_ML,
+                 min_interval=MIN_INTERVAL, max_interval=MAX_INTERVAL):
+        self.clock = clock
+        self.day_end = day_end
+        self.sip_ml = sip_ml
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        # heap of (due, user_id, goal, intake); _live maps each scheduled
+        # user to the one entry of theirs that is current
+        self._heap = []
+        self._live = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._live)
+
+    def __contains__(self, user_id):
+        return user_id in self._live
+
+    def due_at(self, user_id):
+        """When ``user_id`` is next reminded, or ``None``."""
+        entry = self._live.get(user_id)
+        return entry[0] if entry else None
+
+    def update(self, user_id, goal, intake, now=None):
+        """Reschedule ``user_id`` for a new goal or intake; returns the new due time.
+
+        Nothing changes if both are the same as when the user was last
+        scheduled, so calling this on every rerun keeps the existing time.
+        """
+        with self._lock:
+            entry = self._live.get(user_id)
+            if entry is not None and entry[2] == goal and entry[3] == intake:
+                return entry[0]
+            return self._schedule(user_id, goal, intake, self.clock() if now is None else now)
+
+    def cancel(self, user_id):
+        """Stop reminding ``user_id``, e.g. when their session is evicted."""
+        with self._lock:
+            if self._live.pop(user_id, None) is not None and len(self._heap) > 2 * len(self._live) + 1024:
+                self._compact()
+
+    def next_due(self):
+        """Earliest due time of any scheduled user, or ``None``."""
+        with self._lock:
+            heap, live = self._heap, self._live
+            while heap and live.get(heap[0][1]) is not heap[0]:
+                heapq.heappop(heap)
+            return heap[0][0] if heap else None
+
+    def drain(self, limit=None, now=None):
+        """Take up to ``limit`` reminders due by ``now``, earliest first.
+
+        Each user drained is scheduled again from ``now`` with the same goal
+        and intake, so someone who ignores a nudge gets the next one an
+        interval later.
+        """
+        now = self.clock() if now is None else now
+        batch = []
+        with self._lock:
+            heap, live = self._heap, self._live
+            while heap and heap[0][0] <= now and (limit is None or len(batch) < limit):
+                entry = heapq.heappop(heap)
+                due, user_id, goal, intake = entry
+                if live.get(user_id) is not entry:
+                    continue
+                remaining = goal - intake
+                batch.append(Reminder(user_id, due, remaining, min(self.sip_ml, remaining)))
+                self._schedule(user_id, goal, intake, now)
+        return batch
+
+    def _schedule(self, user_id, goal, intake, now):
+        delay = next_nudge_delay(goal, intake, self.day_end(now) - now, self.sip_ml,
+                                 self.min_interval, self.max_interval)
+        if delay is None:
+            self._live.pop(user_id, None)
+            return None
+        entry = (now + delay, user_id, goal, intake)
+        self._live[user_id] = entry
+        heapq.heappush(self._heap, entry)
+        if len(self._heap) > 2 * len(self._live) + 1024:
+            self._compact()
+        return entry[0]
+
+    def _compact(self):
+        # in place, since drain holds a reference to the list
+        self._heap[:] = self._live.values()
+        heapq.heapify(self._heap)
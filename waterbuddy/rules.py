@@ -0,0 +1,163 @@
+"""Threshold and adjustment tables behind the goal calculation.
+
+The tables are loaded from a JSON or TOML file, validated once and compiled
+into tuples that are searched with ``bisect``.  Lookups return the stored
+values directly, so nothing is allocated per call.  Point the
+``WATERBUDDY_RULES`` environment variable at a file to ship different
+guidelines; see ``default_rules.json`` for the layout.
+"""
+
+import json
+import math
+import os
+from bisect import bisect_left, bisect_right
+from functools import lru_cache
+from pathlib import Path
+
+DEFAULT_RULES_PATH = Path(__file__).with_name("default_rules.json")
+RULES_ENV_VAR = "WATERBUDDY_RULES"
+
+
+class RuleTableError(ValueError):
+    pass
+
+
+class ThresholdTable:
+    """Piecewise-constant lookup over sorted bounds.
+
+    ``closed="left"`` means each interval includes its lower bound
+    (``bounds[i-1] <= x < bounds[i]``), ``closed="right"`` its upper bound.
+    """
+
+    __slots__ = ("name", "bounds", "values", "closed", "_search")
+
+    def __init__(self, name, bounds, values, closed="left"):
+        if closed not in ("left", "right"):
+            raise RuleTableError(f"{name}: closed must be 'left' or 'right', got {closed!r}")
+        if not bounds:
+            raise RuleTableError(f"{name}: bounds must not be empty")
+        for b in bounds:
+            if isinstance(b, bool) or not isinstance(b, (int, float)) or not math.isfinite(b):
+                raise RuleTableError(f"{name}: bounds must be finite numbers, got {b!r}")
+        if any(a >= b for a, b in zip(bounds, bounds[1:])):
+            raise RuleTableError(f"{name}: bounds must be strictly increasing")
+        if len(values) != len(bounds) + 1:
+            raise RuleTableError(f"{name}: expected {len(bounds) + 1} values for {len(bounds)} bounds, got {len(values)}")
+        self.name = name
+        self.bounds = tuple(bounds)
+        self.values = tuple(values)
+        self.closed = closed
+        self._search = bisect_right if closed == "left" else bisect_left
+
+    def index(self, x):
+        return self._search(self.bounds, x)
+
+    def lookup(self, x):
+        return self.values[self._search(self.bounds, x)]
+
+
+class MappingTable:
+    __slots__ = ("name", "values", "default")
+
+    def __init__(self, name, values, default=0):
+        if not isinstance(values, dict) or not values:
+            raise RuleTableError(f"{name}: values must be a non-empty mapping")
+        for key, value in values.items():
+            if not isinstance(key, str) or isinstance(value, bool) or not isinstance(value, int):
+                raise RuleTableError(f"{name}: expected str -> int entries, got {key!r}: {value!r}")
+        if isinstance(default, bool) or not isinstance(default, int):
+            raise RuleTableError(f"{name}: default must be an int, got {default!r}")
+        self.name = name
+        self.values = dict(values)
+        self.default = default
+
+    def lookup(self, key):
+        return self.values.get(key, self.default)
+
+
+class RuleSet:
+    __slots__ = ("bmi_category", "base_goal", "progress", "condition_adjustment", "bmi_adjustment")
+
+    def __init__(self, bmi_category, base_goal, progress, condition_adjustment, bmi_adjustment):
+        self.bmi_category = bmi_category
+        self.base_goal = base_goal
+        self.progress = progress
+        self.condition_adjustment = condition_adjustment
+        self.bmi_adjustment = bmi_adjustment
+
+    @property
+    def conditions(self):
+        return tuple(self.condition_adjustment.values)
+
+    @property
+    def bmi_categories(self):
+        return tuple(label for label, _ in self.bmi_category.values)
+
+
+def _table(data, name):
+    table = data.get(name)
+    if not isinstance(table, dict):
+        raise RuleTableError(f"missing table {name!r}")
+    return table
+
+
+def _threshold(data, name, check_value):
+    table = _table(data, name)
+    values = [check_value(name, v) for v in table.get("values", ())]
+    return ThresholdTable(name, list(table.get("bounds", ())), values, table.get("closed", "left"))
+
+
+def _int_value(name, value):
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise RuleTableError(f"{name}: values must be ints, got {value!r}")
+    return value
+
+
+def _pair_value(name, value):
+    if not isinstance(value, (list, tuple)) or len(value) != 2 or not all(isinstance(v, str) for v in value):
+        raise RuleTableError(f"{name}: values must be [str, str] pairs, got {value!r}")
+    return tuple(value)
+
+
+def _mapping(data, name):
+    table = _table(data, name)
+    return MappingTable(name, table.get("values"), table.get("default", 0))
+
+
+def compile_rules(data):
+    """Validate a parsed rules document and compile it into a ``RuleSet``."""
+    if not isinstance(data, dict):
+        raise RuleTableError("rules document must be a mapping of tables")
+    rules = RuleSet(
+        bmi_category=_threshold(data, "bmi_category", _pair_value),
+        base_goal=_threshold(data, "base_goal", _int_value),
+        progress=_threshold(data, "progress", _pair_value),
+        condition_adjustment=_mapping(data, "condition_adjustment"),
+        bmi_adjustment=_mapping(data, "bmi_adjustment"),
+    )
+    missing = [label for label in rules.bmi_categories if label not in rules.bmi_adjustment.values]
+    if missing:
+        raise RuleTableError(f"bmi_adjustment: no entry for categories {missing}")
+    return rules
+
+
+def load_rules(path):
+    path = Path(path)
+    if path.suffix == ".toml":
+        import tomllib
+
+        with open(path, "rb") as f:
+            data = tomllib.load(f)
+    else:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+    try:
+        return compile_rules(data)
+    except RuleTableError as e:
+        raise RuleTableError(f"{path}: {e}") from None
+
+
+@lru_cache(maxsize=None)
+def get_rules():
+    """The active rule set: ``$WATERBUDDY_RULES`` if set, else the defaults."""
+    return load_rules(os.environ.get(RULES_ENV_VAR) or DEFAULT_RULES_PATH)
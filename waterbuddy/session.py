@@ -0,0 +1,199 @@
+"""Per-user session state and the process-wide registry that holds it.
+
+Every field a page reads or writes lives on a ``SessionRecord``; the
+Streamlit session itself only keeps the user id and widget values.  Records
+sit in a ``SessionRegistry`` ordered by last use.  Anything that matters
+across visits is already written through to the ``Store`` as it changes, so
+evicting an idle record only drops it from memory, and the next visit
+rebuilds it from the database.
+
+With a versioned store (``waterbuddy.sharding.ShardedStore``) other replicas
+write the same users, and the registry becomes a read-through cache: each
+record carries the version it was loaded at, ``get`` reloads a record the
+store has moved past, and ``update`` reruns a change on a fresh record when
+its write loses the race.
+"""
+
+import random
+import threading
+import time
+from collections import OrderedDict
+
+from waterbuddy.core import bmi_category, calculate_bmi
+from waterbuddy.history import DayHistory
+from waterbuddy.intake import IntakeLog
+from waterbuddy.rules import get_rules
+from waterbuddy.storage import VersionConflict
+
+USER_LOCK_STRIPES = 64
+
+
+class SessionRecord:
+    """Everything the UI knows about one user, in a fixed set of slots."""
+
+    __slots__ = ("user_id", "step", "age", "height", "weight", "condition", "bmi", "bmi_cat",
+                 "goal", "show_tip", "intake_log", "history", "version", "last_seen")
+
+    def __init__(self, user_id, condition=None):
+        self.user_id = user_id
+        self.step = "input"
+        self.age = None
+        self.height = None
+        self.weight = None
+        self.condition = condition if condition is not None else get_rules().conditions[0]
+        self.bmi = None
+        self.bmi_cat = None
+        self.goal = 0
+        self.show_tip = False
+        self.intake_log = IntakeLog()
+        self.history = DayHistory()
+        # store version the fields reflect; None if the store has no versions
+        self.version = None
+        self.last_seen = 0.0
+
+    @classmethod
+    def from_store(cls, store, user_id):
+        """Rebuild a user's record from the store; a fresh record if unknown."""
+        record = cls(user_id)
+        # Read the version first: a write landing mid-load then leaves the
+        # record newer than its version, which costs a retry, never a lost write.
+        record.version = store.version(user_id)
+        profile = store.load_profile(user_id)
+        if profile is None:
+            return record
+        if profile["age"] is not None:
+            record.set_profile(profile["age"], profile["height"], profile["weight"], profile["condition"])
+            record.goal = profile["goal"]
+            record.step = "tracking" if profile["goal"] else "summary"
+        record.intake_log = store.load_intake(user_id, profile["current_day"])
+        record.history = store.load_history(user_id)
+        return record
+
+    def set_profile(self, age, height, weight, condition):
+        self.age = age
+        self.height = height
+        self.weight = weight
+        self.condition = condition
+        self.bmi = calculate_bmi(weight, height)
+        self.bmi_cat, _ = bmi_category(self.bmi)
+
+    def __repr__(self):
+        return f"SessionRecord(user_id={self.user_id!r}, step={self.step!r}, goal={self.goal})"
+
+
+class SessionRegistry:
+    """LRU map of user id to ``SessionRecord`` with an idle timeout.
+
+    ``get`` is called once per rerun.  It marks the record as used and then
+    evicts from the cold end of the map while it is over ``max_sessions`` or
+    its oldest record has been idle longer than ``ttl`` seconds, so eviction
+    costs O(1) per call amortised and needs no background thread.
+    ``on_evict`` is called with the user id of every record dropped.
+    """
+
+    def __init__(self, store, max_sessions=10_000, ttl=30 * 60, clock=time.monotonic, on_evict=None,
+                 max_retries=20, retry_backoff=0.001):
+        self.store = store
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.clock = clock
+        self.on_evict = on_evict
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self._records = OrderedDict()
+        self._lock = threading.Lock()
+        # update() holds one of these for its user; striped, so no lock per record
+        self._user_locks = [threading.RLock() for _ in range(USER_LOCK_STRIPES)]
+        self._evicted_upto = 0
+        self.evictions = 0
+        self.reloads = 0
+        self.conflicts = 0
+
+    def __len__(self):
+        return len(self._records)
+
+    def __contains__(self, user_id):
+        return user_id in self._records
+
+    def get(self, user_id):
+        now = self.clock()
+        with self._lock:
+            record = self._records.get(user_id)
+            if record is not None:
+                self._records.move_to_end(user_id)
+                record.last_seen = now
+                self._evict(now)
+        if record is not None:
+            if record.version is None or self.store.version(user_id) == record.version:
+                return record
+            # Another replica has written this user since we loaded it.
+            self.invalidate(user_id, record)
+            self.reloads += 1
+        # Load outside the lock so one slow read doesn't stall every session.
+        # A user evicted a moment ago may still have writes in the queue, so
+        # wait for everything queued up to the last eviction to be committed.
+        self.store.flush(upto=self._evicted_upto)
+        loaded = SessionRecord.from_store(self.store, user_id)
+        with self._lock:
+            record = self._records.setdefault(user_id, loaded)
+            self._records.move_to_end(user_id)
+            record.last_seen = now
+            self._evict(now)
+            return record
+
+    def update(self, user_id, action, *args):
+        """Return ``action(record, *args)`` run on the user's current record.
+
+        ``action`` passes ``record.version`` as ``expected_version`` to its
+        store writes and keeps the version they return.  If one raises
+        ``VersionConflict``, whatever ``action`` did to the stale record is
+        thrown away with it, and ``action`` runs again on a reloaded one, at
+        most ``max_retries`` times in all, after a random pause of up to
+        ``retry_backoff`` seconds that doubles with each attempt (capped at
+        0.1s) so replicas racing for one user spread out.  Updates to one user are
+        serialised within the process, so no other session's ``update`` can
+        see a change that is about to be thrown away.
+        """
+        with self._user_locks[hash(user_id) % USER_LOCK_STRIPES]:
+            for attempt in range(self.max_retries):
+                record = self.get(user_id)
+                try:
+                    return action(record, *args)
+                except VersionConflict:
+                    self.invalidate(user_id, record)
+                    self.conflicts += 1
+                    if attempt == self.max_retries - 1:
+                        raise
+                    time.sleep(random.uniform(0, min(self.retry_backoff * 2 ** attempt, 0.1)))
+
+    def invalidate(self, user_id, record=None):
+        """Forget the user's record (only if it is still ``record``, when given)
+        so that the next ``get`` reloads it, after the writes queued so far.
+        ``on_evict`` is not called."""
+        with self._lock:
+            current = self._records.get(user_id)
+            if current is not None and (record is None or current is record):
+                del self._records[user_id]
+                self._evicted_upto = self.store.queued
+
+    def evict_idle(self):
+        """Drop every record idle for longer than ``ttl``; return how many went."""
+        with self._lock:
+            return self._evict(self.clock())
+
+    def _evict(self, now):
+        records = self._records
+        cutoff = now - self.ttl
+        evicted = 0
+        while records:
+            oldest = next(iter(records.values()))
+            if len(records) <= self.max_sessions and oldest.last_seen >= cutoff:
+                break
+            records.popitem(last=False)
+            evicted += 1
+            if self.on_evict is not None:
+                self.on_evict(oldest.user_id)
+        if evicted:
+            self._evicted_upto = self.store.queued
+            self.evictions += evicted
+        return evicted
@@ -0,0 +1,232 @@
+"""Users spread over several SQLite files, for running several app replicas.
+
+``ShardedStore`` places each user on one of its shard files by consistent
+hashing of the user id (``HashRing``).  Every replica that opens the same
+files agrees on where each user lives, and adding a shard moves only about
+1/N of the users.  Each shard has ``Store``'s schema plus a
+``user_versions`` table holding one counter per user.
+
+A replica's ``SessionRegistry`` is a read-through cache over the shards.  A
+record remembers the version it was loaded at; ``SessionRegistry.get``
+reloads it once the shard has moved past that version; and every write
+names the version it was computed from.  The write checks and bumps the
+version in the same ``BEGIN IMMEDIATE`` transaction as the change itself,
+raising ``VersionConflict`` if another replica wrote first, and
+``SessionRegistry.update`` then reloads the user and runs the change again.
+So two replicas logging a drink for the same user at the same moment both
+land, and neither is made from a copy the other has since changed.
+
+Writes commit before they return, one transaction each, because the caller
+needs to know whether the version check passed.  That costs more per tap
+than ``Store``'s group commit, so shards default to ``synchronous=NORMAL``:
+in WAL mode a power cut can lose the last few commits but cannot corrupt
+the file.
+"""
+
+import hashlib
+import os
+import queue
+import threading
+import time
+from bisect import bisect_right
+from contextlib import contextmanager
+from pathlib import Path
+
+from waterbuddy.storage import (
+    _ARCHIVE_DAY,
+    _DELETE_LAST_EVENT,
+    _INSERT_EVENT,
+    _SET_CURRENT_DAY,
+    _UPSERT_PROFILE,
+    SCHEMA,
+    Store,
+    VersionConflict,
+    connect,
+    read_history,
+    read_intake,
+    read_profile,
+)
+
+SHARDS_ENV_VAR = "WATERBUDDY_SHARDS"
+DB_ENV_VAR = "WATERBUDDY_DB"
+
+VERSION_SCHEMA = """
+CREATE TABLE IF NOT EXISTS user_versions (
+    user_id TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+"""
+
+_GET_VERSION = "SELECT version FROM user_versions WHERE user_id = ?"
+_SET_VERSION = """
+INSERT INTO user_versions (user_id, version) VALUES (?, ?)
+ON CONFLICT (user_id) DO UPDATE SET version = excluded.version
+"""
+
+
+def _hash(key):
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """Consistent hashing of string keys onto nodes, ``vnodes`` points per node."""
+
+    def __init__(self, nodes, vnodes=64):
+        points = sorted((_hash(f"{node}#{i}"), node) for node in nodes for i in range(vnodes))
+        if not points:
+            raise ValueError("a hash ring needs at least one node")
+        self._hashes = [h for h, _ in points]
+        self._nodes = [node for _, node in points]
+
+    def node_for(self, key):
+        i = bisect_right(self._hashes, _hash(key))
+        return self._nodes[i % len(self._nodes)]
+
+
+class _Shard:
+    __slots__ = ("path", "writer", "lock", "readers")
+
+    def __init__(self, path, readers, synchronous):
+        self.path = str(path)
+        self.writer = connect(self.path, synchronous)
+        self.writer.executescript(SCHEMA + VERSION_SCHEMA)
+        self.lock = threading.Lock()
+        self.readers = queue.LifoQueue()
+        for _ in range(readers):
+            self.readers.put(connect(self.path, synchronous, read_only=True))
+
+    def close(self):
+        self.writer.close()
+        while not self.readers.empty():
+            self.readers.get().close()
+
+
+class ShardedStore:
+    """``Store``'s interface over several shard files, with a version per user.
+
+    Shards are keyed on the ring by file name rather than full path, so
+    replicas may mount the same files in different places.  Every write
+    returns the user's new version.  With ``expected_version`` it first
+    checks the user is still at that version and raises ``VersionConflict``
+    if not; without it the write always applies.  Users never written have
+    version 0.
+    """
+
+    def __init__(self, paths, vnodes=64, readers=2, synchronous="NORMAL"):
+        self.paths = [str(path) for path in paths]
+        names = [Path(path).name for path in self.paths]
+        if len(set(names)) != len(names):
+            raise ValueError(f"shard files need distinct names, got {names}")
+        self._shards = {name: _Shard(path, readers, synchronous) for name, path in zip(names, self.paths)}
+        self.ring = HashRing(names, vnodes)
+        self.writes = 0
+        self.conflicts = 0
+
+    def shard_for(self, user_id):
+        """Path of the shard file holding ``user_id``."""
+        return self._shards[self.ring.node_for(user_id)].path
+
+    # --- Writes (committed before returning) ---
+
+    def _write(self, user_id, expected_version, sql, *rows):
+        # every row of parameters goes in under a single version bump
+        shard = self._shards[self.ring.node_for(user_id)]
+        conn = shard.writer
+        with shard.lock:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(_GET_VERSION, (user_id,)).fetchone()
+                version = row[0] if row else 0
+                if expected_version is not None and expected_version != version:
+                    self.conflicts += 1
+                    raise VersionConflict(user_id, expected_version, version)
+                conn.executemany(sql, rows)
+                conn.execute(_SET_VERSION, (user_id, version + 1))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            self.writes += 1
+        return version + 1
+
+    def save_profile(self, user_id, age, height, weight, condition, goal, expected_version=None):
+        return self._write(user_id, expected_version, _UPSERT_PROFILE,
+                           (user_id, age, height, weight, condition, goal, time.time()))
+
+    def set_current_day(self, user_id, day, expected_version=None):
+        return self._write(user_id, expected_version, _SET_CURRENT_DAY, (user_id, day, time.time()))
+
+    def archive_day(self, user_id, date, total, goal, expected_version=None):
+        return self._write(user_id, expected_version, _ARCHIVE_DAY, (user_id, date, total, goal))
+
+    def record_intake(self, user_id, day, ts, ml, expected_version=None):
+        return self._write(user_id, expected_version, _INSERT_EVENT, (user_id, day, ts, ml))
+
+    def record_intakes(self, user_id, day, ts, amounts, expected_version=None):
+        return self._write(user_id, expected_version, _INSERT_EVENT, *((user_id, day, ts, ml) for ml in amounts))
+
+    def undo_intake(self, user_id, day, expected_version=None):
+        return self._write(user_id, expected_version, _DELETE_LAST_EVENT, (user_id, day))
+
+    # Nothing is ever queued; these keep SessionRegistry and the metrics
+    # gauges working unchanged.
+
+    @property
+    def queued(self):
+        return 0
+
+    @property
+    def pending(self):
+        return 0
+
+    @property
+    def dropped(self):
+        return 0
+
+    def flush(self, timeout=None, upto=None):
+        return True
+
+    def close(self):
+        for shard in self._shards.values():
+            shard.close()
+
+    # --- Reads ---
+
+    @contextmanager
+    def _reader(self, user_id):
+        readers = self._shards[self.ring.node_for(user_id)].readers
+        conn = readers.get()
+        try:
+            yield conn
+        finally:
+            readers.put(conn)
+
+    def version(self, user_id):
+        with self._reader(user_id) as conn:
+            row = conn.execute(_GET_VERSION, (user_id,)).fetchone()
+        return row[0] if row else 0
+
+    def load_profile(self, user_id):
+        with self._reader(user_id) as conn:
+            return read_profile(conn, user_id)
+
+    def load_intake(self, user_id, current_day=0):
+        with self._reader(user_id) as conn:
+            return read_intake(conn, user_id, current_day)
+
+    def load_history(self, user_id):
+        with self._reader(user_id) as conn:
+            return read_history(conn, user_id)
+
+
+def open_store(environ=os.environ):
+    """The store named by the environment.
+
+    ``WATERBUDDY_SHARDS`` is a comma-separated list of shard files, the same
+    list (in any order) on every replica; without it this is a single
+    ``Store`` at ``WATERBUDDY_DB``.
+    """
+    shards = [path.strip() for path in environ.get(SHARDS_ENV_VAR, "").split(",") if path.strip()]
+    if shards:
+        return ShardedStore(shards)
+    return Store(environ.get(DB_ENV_VAR, "waterbuddy.db"))
@@ -0,0 +1,398 @@
+"""SQLite persistence for profiles and intake events.
+
+One ``Store`` is shared by every session in the process.  Writes never touch
+the database on the caller's thread: they are queued and a background writer
+commits everything that arrived within ``flush_interval`` seconds as a single
+transaction, so a burst of taps from many users costs one WAL fsync.  Reads
+go through a small pool of read-only connections, which WAL lets run
+alongside the writer.
+
+A batch that fails to commit is never counted as written.  Errors such as a
+busy timeout or a full disk roll the batch back and
+retry it, with backoff, until it goes in; writes queued meanwhile wait
+behind it, so ``pending`` grows and ``flush`` keeps waiting.  Any other
+error means one write itself is bad: the batch is replayed one write per
+transaction and only the writes that fail are dropped, counted in
+``dropped`` and logged.  ``error`` holds the last failure until the next
+successful commit.
+
+``Store`` must be the only writer of its file, since other writers' changes
+would never reach the sessions it serves from memory: it holds an exclusive
+lock on ``<path>.lock`` while open and raises ``StoreInUse`` if another
+``Store`` has it (locking needs ``fcntl``, so it is skipped on Windows).  To
+run several app replicas, or the HTTP API next to the app, against shared
+storage use ``waterbuddy.sharding.ShardedStore``, which has the same methods
+plus per-user versions; both take the ``expected_version`` keyword on writes
+so callers need not know which one they hold.
+"""
+
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from waterbuddy.history import DayHistory
+from waterbuddy.intake import IntakeLog
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS profiles (
+    user_id     TEXT PRIMARY KEY,
+    age         INTEGER,
+    height      INTEGER,
+    weight      INTEGER,
+    condition   TEXT,
+    goal        INTEGER NOT NULL DEFAULT 0,
+    current_day INTEGER NOT NULL DEFAULT 0,
+    updated_at  REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS intake_events (
+    user_id TEXT NOT NULL,
+    day     INTEGER NOT NULL,
+    ts      REAL NOT NULL,
+    ml      INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS intake_events_user ON intake_events (user_id, day);
+CREATE TABLE IF NOT EXISTS day_history (
+    user_id TEXT NOT NULL,
+    date    INTEGER NOT NULL,
+    total   INTEGER NOT NULL,
+    goal    INTEGER NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS day_history_user ON day_history (user_id, date);
+"""
+
+PROFILE_FIELDS = ("age", "height", "weight", "condition", "goal")
+
+_UPSERT_PROFILE = """
+INSERT INTO profiles (user_id, age, height, weight, condition, goal, updated_at)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (user_id) DO UPDATE SET
+    age = excluded.age, height = excluded.height, weight = excluded.weight,
+    condition = excluded.condition, goal = excluded.goal, updated_at = excluded.updated_at
+"""
+_SET_CURRENT_DAY = """
+INSERT INTO profiles (user_id, current_day, updated_at) VALUES (?, ?, ?)
+ON CONFLICT (user_id) DO UPDATE SET current_day = excluded.current_day, updated_at = excluded.updated_at
+"""
+_ARCHIVE_DAY = """
+INSERT INTO day_history (user_id, date, total, goal) VALUES (?, ?, ?, ?)
+ON CONFLICT (user_id, date) DO UPDATE SET total = excluded.total, goal = excluded.goal
+"""
+_INSERT_EVENT = "INSERT INTO intake_events (user_id, day, ts, ml) VALUES (?, ?, ?, ?)"
+_DELETE_LAST_EVENT = """
+DELETE FROM intake_events WHERE rowid = (
+    SELECT MAX(rowid) FROM intake_events WHERE user_id = ? AND day = ?
+)
+"""
+
+_STOP = object()
+# seconds between attempts at a batch that keeps failing; doubles up to the max
+RETRY_MIN = 0.05
+RETRY_MAX = 5.0
+# attempts made after close() before giving up on what is still queued
+CLOSE_RETRIES = 5
+# SQLite result codes worth retrying: busy, locked, I/O error, disk full,
+# can't open.  Anything else (no such table, constraint, ...) will fail the
+# same way every time.
+_TRANSIENT = {5, 6, 10, 13, 14}
+
+
+def _transient(error):
+    code = getattr(error, "sqlite_errorcode", None)
+    if code is None:
+        return isinstance(error, sqlite3.OperationalError)
+    return code & 0xFF in _TRANSIENT
+
+
+class StoreInUse(Exception):
+    """Another ``Store`` is already writing the file."""
+
+
+class VersionConflict(Exception):
+    """A write was made from a stale copy of the user: someone else wrote first."""
+
+    def __init__(self, user_id, expected, actual):
+        super().__init__(f"user {user_id!r} is at version {actual}, write expected {expected}")
+        self.user_id = user_id
+        self.expected = expected
+        self.actual = actual
+
+
+def connect(path, synchronous="FULL", read_only=False):
+    """An autocommit WAL connection usable from any thread."""
+    conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(f"PRAGMA synchronous={synchronous}")
+    if read_only:
+        conn.execute("PRAGMA query_only=ON")
+    return conn
+
+
+def _lock(path):
+    """Take ``path``'s writer lock; the open lock file, or ``None`` if there is nothing to lock."""
+    if fcntl is None or path == ":memory:":
+        return None
+    f = open(f"{path}.lock", "a")
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        f.close()
+        raise StoreInUse(f"{path} is already open for writing by another Store") from None
+    return f
+
+
+def read_profile(conn, user_id):
+    row = conn.execute(
+        "SELECT age, height, weight, condition, goal, current_day FROM profiles WHERE user_id = ?",
+        (user_id,),
+    ).fetchone()
+    if row is None:
+        return None
+    return dict(zip(PROFILE_FIELDS + ("current_day",), row))
+
+
+def read_intake(conn, user_id, current_day=0):
+    rows = conn.execute(
+        "SELECT day, ts, ml FROM intake_events WHERE user_id = ? ORDER BY rowid", (user_id,)
+    ).fetchall()
+    return IntakeLog.from_events(rows, current_day)
+
+
+def read_history(conn, user_id):
+    rows = conn.execute(
+        "SELECT date, total, goal FROM day_history WHERE user_id = ? ORDER BY date", (user_id,)
+    ).fetchall()
+    return DayHistory.from_rows(rows)
+
+
+class Store:
+    """Write-behind SQLite store for a single process.
+
+    Writes accept ``expected_version`` only to match ``ShardedStore``; it is
+    ignored, they return ``None`` and ``version()`` is always ``None``.
+    """
+
+    def __init__(self, path, flush_interval=0.05, max_batch=5000, readers=4, synchronous="FULL"):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self._synchronous = synchronous
+        self._queue = queue.SimpleQueue()
+        self._flushed = threading.Condition()
+        self._enqueued = 0
+        self._committed = 0
+        self._dropped = 0
+        self._closing = False
+        self.error = None
+        self._lock_file = _lock(path)
+
+        conn = self._connect()
+        conn.executescript(SCHEMA)
+        conn.close()
+
+        self._readers = queue.LifoQueue()
+        for _ in range(readers):
+            self._readers.put(self._connect(read_only=True))
+        self._writer = threading.Thread(target=self._write_loop, name="waterbuddy-store-writer", daemon=True)
+        self._writer.start()
+
+    def _connect(self, read_only=False):
+        return connect(self.path, self._synchronous, read_only)
+
+    # --- Writes (queued, group-committed) ---
+
+    def _submit(self, sql, params):
+        with self._flushed:
+            self._enqueued += 1
+        self._queue.put((sql, params))
+
+    def save_profile(self, user_id, age, height, weight, condition, goal, expected_version=None):
+        self._submit(_UPSERT_PROFILE, (user_id, age, height, weight, condition, goal, time.time()))
+
+    def set_current_day(self, user_id, day, expected_version=None):
+        self._submit(_SET_CURRENT_DAY, (user_id, day, time.time()))
+
+    def archive_day(self, user_id, date, total, goal, expected_version=None):
+        """Keep a finished day's total; ``date`` is an ordinal (see ``waterbuddy.history``)."""
+        self._submit(_ARCHIVE_DAY, (user_id, date, total, goal))
+
+    def record_intake(self, user_id, day, ts, ml, expected_version=None):
+        self._submit(_INSERT_EVENT, (user_id, day, ts, ml))
+
+    def record_intakes(self, user_id, day, ts, amounts, expected_version=None):
+        """Several drinks logged at once; one write as far as versions go."""
+        for ml in amounts:
+            self._submit(_INSERT_EVENT, (user_id, day, ts, ml))
+
+    def undo_intake(self, user_id, day, expected_version=None):
+        self._submit(_DELETE_LAST_EVENT, (user_id, day))
+
+    def _write_loop(self):
+        conn = self._connect()
+        stop = False
+        batch = []
+        failures = 0
+        while batch or not stop:
+            if not batch:
+                batch = self._next_batch()
+                if _STOP in batch:
+                    stop = True
+                    batch = [op for op in batch if op is not _STOP]
+                if not batch:
+                    continue
+            try:
+                self._commit(conn, batch)
+            except sqlite3.Error as e:
+                if not _transient(e):
+                    committed = self._commit_each(conn, batch)
+                    self._settle(committed, len(batch) - committed)
+                    batch = []
+                    failures = 0
+                    continue
+                failures += 1
+                self.error = e
+                if self._closing and failures >= CLOSE_RETRIES:
+                    # Don't hang shutdown on a database that will not take
+                    # writes: give up on this batch and whatever is behind it.
+                    while not stop:
+                        op = self._queue.get()
+                        if op is _STOP:
+                            stop = True
+                        else:
+                            batch.append(op)
+                    logger.error("store %s: dropping %d writes at close after %d failed commits: %s",
+                                 self.path, len(batch), failures, e)
+                    self._settle(0, len(batch))
+                    break
+                logger.warning("store %s: commit of %d writes failed (%s); retrying", self.path, len(batch), e)
+                time.sleep(min(RETRY_MIN * 2 ** (failures - 1), RETRY_MAX))
+                continue
+            self._settle(len(batch), 0)
+            self.error = None
+            batch = []
+            failures = 0
+        conn.close()
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _commit(self, conn, batch):
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for sql, params in batch:
+                conn.execute(sql, params)
+            conn.execute("COMMIT")
+        except sqlite3.Error:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+
+    def _commit_each(self, conn, batch):
+        # A write that fails on its own with a lasting error fails for good;
+        # a transient one (the lock taken meanwhile) is waited out as above.
+        committed = 0
+        for op in batch:
+            failures = 0
+            while True:
+                try:
+                    self._commit(conn, [op])
+                except sqlite3.Error as e:
+                    self.error = e
+                    failures += 1
+                    if _transient(e) and not (self._closing and failures >= CLOSE_RETRIES):
+                        time.sleep(min(RETRY_MIN * 2 ** (failures - 1), RETRY_MAX))
+                        continue
+                    logger.error("store %s: dropping write %s%r: %s",
+                                 self.path, op[0].split("(")[0].strip(), op[1], e)
+                else:
+                    committed += 1
+                break
+        return committed
+
+    def _settle(self, committed, dropped):
+        with self._flushed:
+            self._committed += committed
+            self._dropped += dropped
+            self._flushed.notify_all()
+
+    @property
+    def queued(self):
+        """Number of writes queued so far; a mark to pass to ``flush(upto=...)``."""
+        return self._enqueued
+
+    @property
+    def pending(self):
+        """Writes queued but neither committed nor dropped yet."""
+        return self._enqueued - self._committed - self._dropped
+
+    @property
+    def dropped(self):
+        """Writes given up on because they failed on their own (or at close)."""
+        return self._dropped
+
+    def flush(self, timeout=None, upto=None):
+        """Block until every write queued before this call is committed.
+
+        With ``upto``, only wait for the writes counted by an earlier
+        ``queued`` reading, which returns at once if those are already in.
+        Returns ``False`` if ``timeout`` ran out first, or if any write was
+        dropped while waiting.
+        """
+        with self._flushed:
+            target = self._enqueued if upto is None else upto
+            dropped = self._dropped
+            settled = self._flushed.wait_for(lambda: self._committed + self._dropped >= target, timeout)
+            return settled and self._dropped == dropped
+
+    def close(self):
+        self._closing = True
+        if self._writer.is_alive():
+            self._queue.put(_STOP)
+            self._writer.join()
+        while not self._readers.empty():
+            self._readers.get().close()
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    # --- Reads ---
+
+    @contextmanager
+    def _reader(self):
+        conn = self._readers.get()
+        try:
+            yield conn
+        finally:
+            self._readers.put(conn)
+
+    def version(self, user_id):
+        return None
+
+    def load_profile(self, user_id):
+        with self._reader() as conn:
+            return read_profile(conn, user_id)
+
+    def load_intake(self, user_id, current_day=0):
+        with self._reader() as conn:
+            return read_intake(conn, user_id, current_day)
+
+    def load_history(self, user_id):
+        with self._reader() as conn:
+            return read_history(conn, user_id)
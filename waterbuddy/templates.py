@@ -0,0 +1,281 @@
+"""HTML for the WaterBuddy pages.
+
+Page styles are minified once at import and always produce the same string,
+so Streamlit's message cache can ship each one to the browser a single time
+per session (see ``.streamlit/config.toml``).  Panels are rendered from
+precompiled templates as one HTML string each, memoized on the values they
+display.
+"""
+
+import datetime
+import re
+from functools import lru_cache
+from html import escape
+
+RENDER_CACHE_SIZE = 512
+
+
+def _style(css):
+    css = re.sub(r"\s+", " ", css)
+    css = re.sub(r"\s*([{};,])\s*", r"\1", css)
+    css = re.sub(r":\s+", ":", css)
+    return f"<style>{css.strip()}</style>"
+
+
+INPUT_CSS = _style("""
+.age-box {background:#e8f1fa; padding:15px; border-radius:12px; margin-bottom:20px;}
+.height-box {background:#faf2ff; padding:15px; border-radius:12px; margin-bottom:20px;}
+.weight-box {background:#ecfbee; padding:15px; border-radius:12px; margin-bottom:20px;}
+.condition-box {background:#fff7e8; padding:15px; border-radius:12px; margin-bottom:12px;}
+.adjustment {font-size:14px; color:#c1440e;}
+.footer {background:#d7e2fd; border-radius:8px; color:#193688; padding:10px; font-size:14px; margin-top:30px; text-align:center;}
+""")
+
+SUMMARY_CSS = _style("""
+.profile-box {background:#e8f1fa; border-radius:12px; padding:15px; margin-bottom:20px; border:1.5px solid #a3c0ff;}
+.profile-title {font-weight:bold; text-align:center; margin-bottom:12px; font-size:18px;}
+.profile-data {display:flex; gap:15px; justify-content:center; flex-wrap: wrap;}
+.profile-item {background:#fff; border-radius:12px; padding:15px 20px; min-width:90px; text-align:center; box-shadow:0 0 6px #d0d9f2; font-weight:600; font-size:14px;}
+.profile-key {font-size:14px; color:#1f3e82; margin-bottom:6px;}
+.profile-value {font-size:20px; font-weight:700; color:#1f3e82;}
+.bmi-value {font-size:26px; font-weight:700; color:#800080; margin-bottom:0;}
+.bmi-category {font-size:14px; font-weight:600; color:#a96216;}
+.condition {font-weight:600; margin-top:15px; color:#a85d00; font-size:16px; text-align:center;}
+.goal-box {background:#ecfbee; border-radius:12px; padding:20px 15px; box-shadow:0 1px 3px #a4d09c; margin-bottom:20px;}
+.goal-row {display:flex; justify-content:space-between; padding:8px 12px; background:#fff; margin:6px 0; border-radius:8px; align-items:center; font-weight:600; font-size:14px;}
+.goal-label {margin:0; color:#193688;}
+.goal-value {font-weight:700; font-size:16px;}
+.goal-base {color:#193688;}
+.goal-bmi-adjustment {color:#800080;}
+.goal-condition {color:#d16f00;}
+.final-goal {background:#0e8a1b; color:#fff; padding:15px 0; text-align:center; border-radius:8px; font-weight:900; font-size:30px; margin-top:15px;}
+.btn-back, .btn-start {font-weight:700; padding:12px 0; border-radius:8px; cursor:pointer; border:none; font-size:16px; width:48%;}
+.btn-back {background:#babfc5; color:#555c69;}
+.btn-start {background:#1850f5; color:#fff;}
+.btn-block {display:flex; justify-content:space-between; gap:12px;}
+""")
+
+# The stats row, water glass and quick-add buttons are styled inside the
+# intake_buttons component (waterbuddy/components/intake_buttons).
+TRACKING_CSS = _style("""
+.input-ml {
+    border-radius: 10px;
+    border: 2px solid #55c6ff;
+    padding: 10px 12px;
+    width: 180px;
+    font-size: 14px;
+}
+.btn-reset {
+    background-color: #babfc5;
+    color: #555c69;
+    border: none;
+    padding: 12px 15px;
+    margin-top: 20px;
+    border-radius: 8px;
+    font-weight: 600;
+    cursor: pointer;
+}
+.btn-tip {
+    background-color: #faf2ff;
+    border: 2px solid #ad84ff;
+    color: #7318ff;
+    padding: 12px 15px;
+    font-weight: 700;
+    border-radius: 8px;
+    margin-top: 20px;
+    cursor: pointer;
+}
+.tip-box {
+    background-color: #faf2ff;
+    border: 2px solid #ad84ff;
+    color: #7318ff;
+    border-radius: 12px;
+    padding: 15px;
+    margin-top: 10px;
+    font-weight: 500;
+    font-size: 14px;
+}
+.history-row {
+    display: flex;
+    justify-content: space-around;
+    gap: 8px;
+    background-color: #ecfbee;
+    border-radius: 12px;
+    padding: 10px;
+    margin-top: 15px;
+    text-align: center;
+}
+.history-value {font-weight: 700; font-size: 18px; color: #1f6521;}
+.history-key {font-size: 12px; color: #555c69;}
+""")
+
+RESET_CSS = _style("""
+.warning-emoji {font-size: 80px; text-align: center; margin-bottom: 10px;}
+.warning-text {text-align: center; color: #841c1c; font-weight: 700; font-size: 22px; margin-bottom: 15px;}
+.explanation {font-size: 16px; color: #454851; text-align: center; margin-bottom: 20px;}
+.progress-box {
+    background-color: #d7e2fd;
+    border-radius: 12px;
+    padding: 15px;
+    margin-bottom: 20px;
+    font-weight: 600;
+    text-align:center;
+    color: #193688;
+}
+.danger-zone {
+    background-color: #f9d7d3;
+    border-radius: 12px;
+    padding: 12px;
+    color: #841c1c;
+    font-weight: 700;
+    margin-bottom: 25px;
+    text-align:center;
+}
+.btn-cancel {
+    background-color: #babfc5;
+    color: #555c69;
+    padding: 12px 25px;
+    border-radius: 10px;
+    font-weight: 600;
+    cursor: pointer;
+    border: none;
+    margin-right: 20px;
+    font-size: 16px;
+}
+.btn-reset {
+    background-color: #b91f1f;
+    color: white;
+    padding: 12px 25px;
+    border-radius: 10px;
+    font-weight: 700;
+    cursor: pointer;
+    border: none;
+    font-size: 16px;
+}
+.btn-container {
+    display: flex;
+    justify-content: center;
+}
+""")
+
+ADMIN_CSS = _style("""
+.admin-stats {display:flex; justify-content:space-around; gap:10px; flex-wrap:wrap; margin-bottom:20px;}
+.admin-stat {background:#e8f1fa; border-radius:12px; padding:12px 18px; min-width:110px; text-align:center;}
+.admin-key {font-size:13px; color:#1f3e82;}
+.admin-value {font-size:22px; font-weight:700; color:#193688;}
+.admin-title {font-weight:bold; font-size:17px; color:#193688; margin:15px 0 8px 0;}
+.admin-bar-row {display:flex; align-items:center; gap:8px; margin:4px 0; font-size:14px;}
+.admin-bar-label {width:150px; color:#31333f;}
+.admin-bar-track {flex:1; background:#eef3fb; border-radius:6px; height:16px;}
+.admin-bar {background:#439eff; border-radius:6px; height:16px;}
+.admin-bar-count {width:70px; text-align:right; font-weight:600; color:#193688;}
+.admin-table {border-collapse:collapse; width:100%; font-size:14px;}
+.admin-table th, .admin-table td {padding:6px 10px; border-bottom:1px solid #e3e8f2; text-align:right;}
+.admin-table th:first-child, .admin-table td:first-child {text-align:left;}
+.admin-note {font-size:12px; color:gray; margin-top:12px;}
+""")
+
+HEADER = (
+    "<h1 style='text-align:center; color:#1f3e82;'>💧</h1>"
+    "<h1 style='text-align:center; color:#1f3e82;'>Welcome to WaterBuddy+</h1>"
+    "<p style='text-align:center; color:gray;'>Your personalized hydration companion</p>"
+)
+FOOTER = '<div class="footer">💡 No login required &bull; All data stays private &bull; Free forever</div>'
+TIP_BOX = '<div class="tip-box">💡 Staying hydrated keeps your skin healthy and glowing!</div>'
+
+_PROFILE_CARD = (
+    '<div class="profile-box">'
+    '<p class="profile-title">Your Personalized Profile</p>'
+    '<div class="profile-data">'
+    '<div class="profile-item"><div class="profile-key">Age</div><div class="profile-value">{age} years</div></div>'
+    '<div class="profile-item"><div class="profile-key">BMI</div><div class="bmi-value">{bmi}</div><div class="bmi-category">{bmi_cat}</div></div>'
+    '<div class="profile-item"><div class="profile-key">Height</div><div class="profile-value" style="color:#1f6521;">{height} cm</div></div>'
+    '<div class="profile-item"><div class="profile-key">Weight</div><div class="profile-value" style="color:#1f6521;">{weight} kg</div></div>'
+    '</div>'
+    '<p class="condition">🏃 {condition}</p>'
+    '</div>'
+).format
+
+_GOAL_BOX = (
+    '<div class="goal-box">'
+    '<div style="font-weight:bold; font-size:17px; padding-bottom: 10px;">Goal Calculation</div>'
+    '<div class="goal-row"><p class="goal-label">Base Goal (Age)</p><p class="goal-value goal-base">{base} ml</p></div>'
+    '<div class="goal-row"><p class="goal-label">BMI Adjustment<br><small style="color:#a96216;">({bmi_cat})</small></p><p class="goal-value goal-bmi-adjustment">{bmi_adj} ml</p></div>'
+    '<div class="goal-row"><p class="goal-label">Health Condition</p><p class="goal-value goal-condition">{cond_adj:+d} ml</p></div>'
+    '<div class="final-goal">Your Daily Goal<br><span style="font-size:36px;">{total} ml</span></div>'
+    '</div>'
+).format
+
+_RESET_PANEL = (
+    '<div class="warning-emoji">⚠️</div>'
+    '<div class="warning-text">Start New Day?</div>'
+    '<div class="explanation">This will clear your current progress and reset your daily water intake to 0 ml.</div>'
+    '<div class="progress-box"><strong>Current progress:</strong><br>{water} ml / {goal} ml ({percent}%)<br>'
+    '<progress value="{water}" max="{goal}" style="width: 100%; height: 20px;"></progress></div>'
+    '<div class="danger-zone">⚠️ This action cannot be undone</div>'
+).format
+
+
+_HISTORY_ITEM = '<div><div class="history-value">{value}</div><div class="history-key">{key}</div></div>'.format
+
+
+@lru_cache(maxsize=RENDER_CACHE_SIZE)
+def history_row(streak, average_7, average_30, best_total, best_date):
+    """Streak, 7/30-day averages (ml/day) and best day; ``best_date`` is ISO."""
+    items = [_HISTORY_ITEM(value=f"🔥 {streak}", key="day streak")]
+    if average_7 is not None:
+        items.append(_HISTORY_ITEM(value=f"{average_7:,} ml", key="7-day average"))
+        items.append(_HISTORY_ITEM(value=f"{average_30:,} ml", key="30-day average"))
+    if best_total is not None:
+        when = datetime.date.fromisoformat(best_date).strftime("%b %d")
+        items.append(_HISTORY_ITEM(value=f"🏆 {best_total:,} ml", key=f"best day ({when})"))
+    return f'<div class="history-row">{"".join(items)}</div>'
+
+
+@lru_cache(maxsize=RENDER_CACHE_SIZE)
+def profile_card(age, bmi, bmi_cat, height, weight, condition):
+    return _PROFILE_CARD(
+        age=age, bmi=bmi, bmi_cat=escape(bmi_cat), height=height, weight=weight, condition=escape(condition)
+    )
+
+
+@lru_cache(maxsize=RENDER_CACHE_SIZE)
+def goal_box(base, bmi_cat, bmi_adj, cond_adj, total):
+    return _GOAL_BOX(base=base, bmi_cat=escape(bmi_cat), bmi_adj=bmi_adj, cond_adj=cond_adj, total=total)
+
+
+@lru_cache(maxsize=RENDER_CACHE_SIZE)
+def reset_panel(water, goal, percent):
+    return _RESET_PANEL(water=water, goal=goal, percent=percent)
+
+
+_ADMIN_STAT = '<div class="admin-stat"><div class="admin-key">{key}</div><div class="admin-value">{value}</div></div>'.format
+_ADMIN_BAR = (
+    '<div class="admin-bar-row"><div class="admin-bar-label">{label}</div>'
+    '<div class="admin-bar-track"><div class="admin-bar" style="width:{width:.1f}%;"></div></div>'
+    '<div class="admin-bar-count">{count:,}</div></div>'
+).format
+
+
+def _admin_bars(title, rows):
+    top = max((count for _, count in rows), default=0) or 1
+    bars = "".join(_ADMIN_BAR(label=escape(label), width=max(count, 0) / top * 100, count=count)
+                   for label, count in rows)
+    return f'<div class="admin-title">{title}</div>{bars}'
+
+
+def admin_panel(stats, progress_rows, bmi_rows, quantile_rows, note):
+    """The whole admin dashboard; every argument is a short list, so its cost
+    does not depend on how many users the numbers cover."""
+    cells = "".join(_ADMIN_STAT(key=key, value=value) for key, value in stats)
+    header = "".join(f"<th>{escape(h)}</th>" for h in quantile_rows[0])
+    body = "".join("<tr>" + "".join(f"<td>{escape(str(v))}</td>" for v in row) + "</tr>"
+                   for row in quantile_rows[1:])
+    return (
+        f'<div class="admin-stats">{cells}</div>'
+        + _admin_bars("Progress today", progress_rows)
+        + _admin_bars("BMI categories", bmi_rows)
+        + f'<div class="admin-title">Percentiles</div>'
+        f'<table class="admin-table"><tr>{header}</tr>{body}</table>'
+        f'<div class="admin-note">{escape(note)}</div>'
+    )
@@ -0,0 +1,429 @@
+"""Streaming export and import of profiles and intake history.
+
+A backup is a directory with one file per table, ``profiles``,
+``intake_events`` and ``day_history``, written either as CSV or in the compact columnar ``.wbc``
+format below.  Both directions work on fixed-size chunks of rows pulled
+through generators, so memory stays flat however many events there are::
+
+    python -m waterbuddy.transfer export waterbuddy.db backup/ --format wbc
+    python -m waterbuddy.transfer import backup/ other.db
+
+Imports are resumable.  Every chunk is committed in the same transaction as
+a checkpoint row recording how many rows of that file are in, keyed on a
+digest of the whole file, so an import that is killed part way picks up
+after the last committed chunk when run again, and re-running a finished
+import adds nothing.
+
+``.wbc`` layout (all integers little-endian)::
+
+    b"WBC1"  u16 column count  then per column: u8 type, u8 name length, name
+    chunks:  u32 rows  u64 payload bytes  payload
+    end:     u32 0
+
+A chunk's payload holds each column in turn: a u8 null flag, followed by
+``rows`` validity bytes if it is set, then the values.  ``real`` columns are
+raw float64.  ``int`` columns are a u8 ``array`` typecode followed by the
+values at the narrowest signed width that fits the chunk (``b``, ``h``,
+``i`` or ``q``).  ``text`` columns are dictionary encoded per chunk: u32
+entry count, each entry as u16 length plus UTF-8, then a typecode and one
+unsigned code per row (``B``, ``H`` or ``I``), so a user id costs one to
+four bytes per event however long it is.
+"""
+
+import argparse
+import csv
+import hashlib
+import sqlite3
+import struct
+import sys
+import time
+from array import array
+from pathlib import Path
+
+from waterbuddy.storage import SCHEMA
+
+DEFAULT_CHUNK_SIZE = 65_536
+FORMATS = ("csv", "wbc")
+
+# table -> ((column, type), ...) in file order
+TABLES = {
+    "profiles": (
+        ("user_id", "text"), ("age", "int"), ("height", "int"), ("weight", "int"), ("condition", "text"),
+        ("goal", "int"), ("current_day", "int"), ("updated_at", "real"),
+    ),
+    "intake_events": (("user_id", "text"), ("day", "int"), ("ts", "real"), ("ml", "int")),
+    "day_history": (("user_id", "text"), ("date", "int"), ("total", "int"), ("goal", "int")),
+}
+# Backups made before day history existed have no file for it.
+OPTIONAL_TABLES = frozenset({"day_history"})
+
+_INSERT = {
+    "profiles": """
+INSERT INTO profiles (user_id, age, height, weight, condition, goal, current_day, updated_at)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (user_id) DO UPDATE SET
+    age = excluded.age, height = excluded.height, weight = excluded.weight,
+    condition = excluded.condition, goal = excluded.goal, current_day = excluded.current_day,
+    updated_at = excluded.updated_at
+""",
+    "intake_events": "INSERT INTO intake_events (user_id, day, ts, ml) VALUES (?, ?, ?, ?)",
+    "day_history": """
+INSERT INTO day_history (user_id, date, total, goal) VALUES (?, ?, ?, ?)
+ON CONFLICT (user_id, date) DO UPDATE SET total = excluded.total, goal = excluded.goal
+""",
+}
+
+CHECKPOINT_SCHEMA = """
+CREATE TABLE IF NOT EXISTS import_checkpoints (
+    source     TEXT PRIMARY KEY,
+    rows       INTEGER NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+_SAVE_CHECKPOINT = """
+INSERT INTO import_checkpoints (source, rows, updated_at) VALUES (?, ?, ?)
+ON CONFLICT (source) DO UPDATE SET rows = excluded.rows, updated_at = excluded.updated_at
+"""
+
+MAGIC = b"WBC1"
+_TYPE_CODES = {"int": 1, "real": 2, "text": 3}
+_TYPE_NAMES = {code: name for name, code in _TYPE_CODES.items()}
+_INT_WIDTHS = (("b", 1 << 7), ("h", 1 << 15), ("i", 1 << 31), ("q", 1 << 63))
+_CODE_WIDTHS = (("B", 1 << 8), ("H", 1 << 16), ("I", 1 << 32))
+_CHUNK_HEADER = struct.Struct("<IQ")
+_BIG_ENDIAN = sys.byteorder == "big"
+
+
+class TransferError(ValueError):
+    """A backup file is malformed or does not match the expected table."""
+
+
+# --- Reading and writing the database ---
+
+def iter_table_chunks(conn, table, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield lists of row tuples from ``table`` in insertion order.
+
+    Pages by rowid, so each chunk is one indexed range scan and the database
+    never holds a cursor open across chunks.
+    """
+    names = ", ".join(name for name, _ in TABLES[table])
+    sql = f"SELECT rowid, {names} FROM {table} WHERE rowid > ? ORDER BY rowid LIMIT ?"
+    last = 0
+    while True:
+        rows = conn.execute(sql, (last, chunk_size)).fetchall()
+        if not rows:
+            return
+        last = rows[-1][0]
+        yield [row[1:] for row in rows]
+
+
+def _source_key(path, table):
+    """Identify a backup file by table and a digest of its whole contents.
+
+    Any change anywhere in the file gives a new key, so a newer backup is
+    never mistaken for one already imported.  Reading the file once more
+    costs far less than the import itself.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        while block := f.read(1 << 20):
+            digest.update(block)
+    return f"{table}:{digest.hexdigest()}"
+
+
+def load_chunks(conn, table, chunks, source):
+    """Insert ``chunks`` into ``table``, checkpointing each under ``source``.
+
+    Rows the checkpoint already covers are skipped.  Returns the number of
+    rows inserted by this call.
+    """
+    conn.executescript(CHECKPOINT_SCHEMA)
+    row = conn.execute("SELECT rows FROM import_checkpoints WHERE source = ?", (source,)).fetchone()
+    done = row[0] if row else 0
+    seen = inserted = 0
+    insert = _INSERT[table]
+    for rows in chunks:
+        end = seen + len(rows)
+        if end > done:
+            rows = rows[done - seen:] if seen < done else rows
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.executemany(insert, rows)
+                conn.execute(_SAVE_CHECKPOINT, (source, end, time.time()))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            inserted += len(rows)
+            done = end
+        seen = end
+    return inserted
+
+
+# --- CSV ---
+
+def write_csv(chunks, f, table):
+    """Write ``chunks`` of ``table`` rows to text file ``f`` with a header."""
+    writer = csv.writer(f, lineterminator="\n")
+    writer.writerow([name for name, _ in TABLES[table]])
+    rows = 0
+    for chunk in chunks:
+        writer.writerows(chunk)
+        rows += len(chunk)
+    return rows
+
+
+def _csv_converter(kind):
+    convert = {"int": int, "real": float, "text": str}[kind]
+    return lambda value: convert(value) if value != "" else None
+
+
+def read_csv(f, table, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield lists of typed row tuples from a CSV written by ``write_csv``."""
+    columns = TABLES[table]
+    reader = csv.reader(f)
+    header = next(reader, None)
+    if header != [name for name, _ in columns]:
+        raise TransferError(f"{table}: expected columns {[n for n, _ in columns]}, got {header}")
+    converters = [_csv_converter(kind) for _, kind in columns]
+    chunk = []
+    for line_no, values in enumerate(reader, start=2):
+        try:
+            chunk.append(tuple(c(v) for c, v in zip(converters, values, strict=True)))
+        except ValueError as e:
+            raise TransferError(f"{table}: bad row on line {line_no}: {e}") from None
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# --- Columnar ---
+
+def _typecode(widths, low, high):
+    return next(code for code, limit in widths if -limit <= low and high < limit)
+
+
+def _pack_column(values, kind, out):
+    nulls = None in values
+    out.append(b"\x01" if nulls else b"\x00")
+    if nulls:
+        out.append(bytes(v is not None for v in values))
+    if kind == "real":
+        data = array("d", [v or 0.0 for v in values] if nulls else values)
+    elif kind == "int":
+        if nulls:
+            values = [v or 0 for v in values]
+        code = _typecode(_INT_WIDTHS, min(values), max(values))
+        out.append(code.encode())
+        data = array(code, values)
+    else:
+        index = {}
+        codes = [index.setdefault(v or "", len(index)) for v in values]
+        out.append(struct.pack("<I", len(index)))
+        for value in index:
+            encoded = value.encode()
+            out.append(struct.pack("<H", len(encoded)))
+            out.append(encoded)
+        code = _typecode(_CODE_WIDTHS, 0, len(index) - 1)
+        out.append(code.encode())
+        data = array(code, codes)
+    if _BIG_ENDIAN:
+        data.byteswap()
+    out.append(data.tobytes())
+
+
+def write_columnar(chunks, f, table):
+    """Write ``chunks`` of ``table`` rows to binary file ``f`` as ``.wbc``."""
+    columns = TABLES[table]
+    header = [MAGIC, struct.pack("<H", len(columns))]
+    for name, kind in columns:
+        header.append(struct.pack("<BB", _TYPE_CODES[kind], len(name)) + name.encode())
+    f.write(b"".join(header))
+    rows = 0
+    for chunk in chunks:
+        if not chunk:
+            continue
+        parts = []
+        for (name, kind), values in zip(columns, zip(*chunk)):
+            try:
+                _pack_column(values, kind, parts)
+            except TypeError:
+                # SQLite keeps whatever was stored, e.g. a float height
+                bad = next(v for v in values if v is not None and type(v) is not {"int": int, "real": float}[kind])
+                raise TransferError(f"{table}.{name}: {bad!r} does not fit a {kind} column") from None
+        payload = b"".join(parts)
+        f.write(_CHUNK_HEADER.pack(len(chunk), len(payload)))
+        f.write(payload)
+        rows += len(chunk)
+    f.write(struct.pack("<I", 0))
+    return rows
+
+
+def _read_array(buf, pos, n, code):
+    if code not in "bhiqBHId":
+        raise TransferError(f"unknown column typecode {code!r}")
+    data = array(code)
+    end = pos + data.itemsize * n
+    if end > len(buf):
+        raise TransferError("chunk is shorter than its columns")
+    data.frombytes(buf[pos:end])
+    if _BIG_ENDIAN:
+        data.byteswap()
+    return data, end
+
+
+def _unpack_column(buf, pos, n, kind):
+    nulls = buf[pos]
+    pos += 1
+    valid = None
+    if nulls:
+        valid = buf[pos:pos + n]
+        pos += n
+    if kind == "text":
+        (count,) = struct.unpack_from("<I", buf, pos)
+        pos += 4
+        entries = []
+        for _ in range(count):
+            (length,) = struct.unpack_from("<H", buf, pos)
+            pos += 2
+            entries.append(bytes(buf[pos:pos + length]).decode())
+            pos += length
+        codes, pos = _read_array(buf, pos + 1, n, chr(buf[pos]))
+        values = [entries[c] for c in codes]
+    elif kind == "int":
+        values, pos = _read_array(buf, pos + 1, n, chr(buf[pos]))
+        values = values.tolist()
+    else:
+        values, pos = _read_array(buf, pos, n, "d")
+        values = values.tolist()
+    if valid is not None:
+        values = [v if ok else None for v, ok in zip(values, valid)]
+    return values, pos
+
+
+def read_columnar(f, table):
+    """Yield lists of row tuples from a ``.wbc`` file, one list per stored chunk."""
+    expected = TABLES[table]
+    if f.read(4) != MAGIC:
+        raise TransferError(f"{table}: not a .wbc file")
+    (count,) = struct.unpack("<H", f.read(2))
+    columns = []
+    for _ in range(count):
+        code, length = struct.unpack("<BB", f.read(2))
+        columns.append((f.read(length).decode(), _TYPE_NAMES.get(code)))
+    if tuple(columns) != expected:
+        raise TransferError(f"{table}: expected columns {expected}, got {tuple(columns)}")
+    while True:
+        head = f.read(4)
+        if len(head) < 4:
+            raise TransferError(f"{table}: file is truncated")
+        (n,) = struct.unpack("<I", head)
+        if n == 0:
+            return
+        (size,) = struct.unpack("<Q", f.read(8))
+        buf = memoryview(f.read(size))
+        if len(buf) < size:
+            raise TransferError(f"{table}: file is truncated")
+        pos = 0
+        values = []
+        for _, kind in columns:
+            column, pos = _unpack_column(buf, pos, n, kind)
+            values.append(column)
+        yield list(zip(*values))
+
+
+# --- Whole backups ---
+
+def _open(path, fmt, mode):
+    if fmt == "csv":
+        return open(path, mode, newline="", encoding="utf-8")
+    return open(path, mode + "b")
+
+
+def export_db(db_path, out_dir, fmt="wbc", chunk_size=DEFAULT_CHUNK_SIZE):
+    """Write every table of ``db_path`` into ``out_dir``; returns rows per table."""
+    if fmt not in FORMATS:
+        raise ValueError(f"format must be one of {FORMATS}, got {fmt!r}")
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    write = write_csv if fmt == "csv" else write_columnar
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, isolation_level=None)
+    counts = {}
+    try:
+        # One read transaction, so all files come from the same snapshot
+        # even while the app keeps writing.
+        conn.execute("BEGIN")
+        present = {name for name, in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        for table in TABLES:
+            if table in OPTIONAL_TABLES and table not in present:
+                continue
+            with _open(out_dir / f"{table}.{fmt}", fmt, "w") as f:
+                counts[table] = write(iter_table_chunks(conn, table, chunk_size), f, table)
+    finally:
+        conn.close()
+    return counts
+
+
+def import_db(in_dir, db_path, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Load a backup directory into ``db_path``; returns rows inserted per table.
+
+    Each table file may be CSV or ``.wbc``.  Profiles are upserted by user
+    id; events are appended, with the checkpoint preventing duplicates when
+    an import is run again.
+    """
+    in_dir = Path(in_dir)
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    counts = {}
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        # Events arrive in time order but land all over the (user_id, day)
+        # index; a bigger page cache keeps those inserts off the disk.
+        conn.execute("PRAGMA cache_size=-65536")
+        conn.executescript(SCHEMA)
+        for table in TABLES:
+            for fmt in FORMATS:
+                path = in_dir / f"{table}.{fmt}"
+                if path.exists():
+                    break
+            else:
+                if table in OPTIONAL_TABLES:
+                    continue
+                raise TransferError(f"no {table}.csv or {table}.wbc in {in_dir}")
+            with _open(path, fmt, "r") as f:
+                chunks = read_csv(f, table, chunk_size) if fmt == "csv" else read_columnar(f, table)
+                counts[table] = load_chunks(conn, table, chunks, _source_key(path, table))
+    finally:
+        conn.close()
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export or import WaterBuddy profiles and intake history.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    exp = sub.add_parser("export", help="write a backup directory from a database")
+    exp.add_argument("db", help="SQLite database to read")
+    exp.add_argument("out", help="directory to write profiles and intake_events files into")
+    exp.add_argument("--format", choices=FORMATS, default="wbc")
+    exp.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="rows per chunk")
+    imp = sub.add_parser("import", help="load a backup directory into a database (resumable)")
+    imp.add_argument("src", help="backup directory written by export")
+    imp.add_argument("db", help="SQLite database to load into (created if missing)")
+    imp.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="rows per transaction for CSV")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == "export":
+            counts = export_db(args.db, args.out, args.format, args.chunk_size)
+        else:
+            counts = import_db(args.src, args.db, args.chunk_size)
+    except TransferError as e:
+        sys.exit(f"error: {e}")
+    for table, rows in counts.items():
+        print(f"{table}: {rows} rows {'exported' if args.command == 'export' else 'imported'}")
+
+
+if __name__ == "__main__":
+    main()